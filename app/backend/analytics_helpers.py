@@ -4,9 +4,8 @@ Calculates submission rates, average grades, and late submission percentages.
 """
 
 from typing import Dict, List, Any, Optional
-from datetime import datetime
 import logging
-from db_helpers import supabase, get_teacher_students, get_teacher_submissions, get_class_students
+from db_helpers import supabase, get_teacher_students, get_teacher_submissions_full, get_class_students, teacher_owns_class
 
 logger = logging.getLogger(__name__)
 
@@ -28,13 +27,14 @@ def get_assignment_analytics(teacher_id: str, assignment_id: Optional[str] = Non
         logger.error("Supabase not configured")
         return {"assignments": [], "error": "Database not configured"}
     
+    import pandas as pd  # deferred so importing this module at app startup doesn't load pandas
+    
     try:
         # Get students - if class_id is provided, only get students from that class
         if class_id:
             students = get_class_students(class_id)
             # Verify this class belongs to the teacher
-            teacher_classes_result = supabase.table("teacher_class").select("class_id").eq("teacher_id", teacher_id).eq("class_id", class_id).execute()
-            if not teacher_classes_result.data:
+            if not teacher_owns_class(teacher_id, class_id):
                 return {
                     "assignments": [],
                     "total_students": 0,
@@ -78,7 +78,7 @@ def get_assignment_analytics(teacher_id: str, assignment_id: Optional[str] = Non
             due_date = assignment.get("due_date")
             
             # Get all submissions for this assignment
-            submissions = get_teacher_submissions(teacher_id, assignment_id)
+            submissions = get_teacher_submissions_full(teacher_id, assignment_id)
             
             # Calculate metrics
             students_submitted = len(submissions)
@@ -96,13 +96,13 @@ def get_assignment_analytics(teacher_id: str, assignment_id: Optional[str] = Non
             # Calculate late submissions percentage
             late_count = 0
             if due_date:
-                due_datetime = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                for submission in submissions:
-                    submitted_at = submission.get("submitted_at")
-                    if submitted_at:
-                        submitted_datetime = datetime.fromisoformat(submitted_at.replace('Z', '+00:00'))
-                        if submitted_datetime > due_datetime:
-                            late_count += 1
+                due_datetime = pd.to_datetime(due_date, utc=True, format="ISO8601")
+                # Parse all submission timestamps in one vectorized pass (missing/invalid -> NaT, never late)
+                submitted_datetimes = pd.to_datetime(
+                    [s.get("submitted_at") for s in submissions],
+                    utc=True, errors="coerce", format="ISO8601"
+                )
+                late_count = int((submitted_datetimes > due_datetime).sum())
                 
                 late_submissions_pct = (late_count / students_submitted * 100) if students_submitted > 0 else 0
             else:
@@ -12,24 +12,10 @@ Tracks:
 import logging
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-from supabase import Client
-import os
+from db_helpers import supabase  # shared service-role client for audit logging
 
 logger = logging.getLogger(__name__)
 
-# Supabase client for audit logging
-SUPABASE_URL = os.getenv("SUPABASE_URL", "")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY", "")
-
-supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_SERVICE_KEY:
-    try:
-        from supabase import create_client
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-        logger.info("✓ Supabase client initialized for audit logging")
-    except Exception as e:
-        logger.warning(f"Could not initialize Supabase client for audit: {e}")
-
 
 def estimate_tokens(text: str) -> int:
     """Rough token estimation (1 token ≈ 4 characters)"""
@@ -10,28 +10,20 @@ Provides:
 
 from fastapi import HTTPException, Security, Depends, Header, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, FrozenSet
 from functools import wraps
 import logging
 import os
-from supabase import create_client, Client
+from db_helpers import supabase  # shared service-role client for auth verification
 
 logger = logging.getLogger(__name__)
 
-# Supabase client for auth verification
-SUPABASE_URL = os.getenv("SUPABASE_URL", "")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY", "")  # Service role key for backend
-
-supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_SERVICE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-        logger.info("✓ Supabase client initialized for auth")
-    except Exception as e:
-        logger.warning(f"Could not initialize Supabase client: {e}")
-
 security = HTTPBearer(auto_error=False)
 
+# User IDs issued by the dev auth bypass (see DEV_AUTH_BYPASS.md)
+DEV_USER_ID = "00000000-0000-0000-0000-000000000001"
+DEV_USER_IDS = frozenset({DEV_USER_ID, "dev-user-id", os.getenv("DEV_USER_ID", DEV_USER_ID)})
+
 
 class UserContext:
     """User context extracted from JWT token"""
@@ -40,6 +32,8 @@ class UserContext:
         self.email = email
         self.role = role
         self.name = name
+        # Classes taught by this user; filled on first use within a request (teachers only)
+        self.teacher_class_ids: Optional[FrozenSet[str]] = None
     
     def is_admin(self) -> bool:
         return self.role == "admin"
@@ -112,7 +106,7 @@ async def get_current_user(
                         logger.info(f"✓ Token parsed as JSON: {token_data}")
                         if isinstance(token_data, dict) and "role" in token_data:
                             role = token_data["role"]
-                            user_id = token_data.get("id", "00000000-0000-0000-0000-000000000001")
+                            user_id = token_data.get("id", DEV_USER_ID)
                             email = token_data.get("email", "dev@example.com")
                             name = token_data.get("name", "Dev User")
                             logger.info(f"✓ Extracted role from token: {role} for user {email}")
@@ -155,13 +149,13 @@ async def get_current_user(
         
         # Fallback: Use default dev user (teacher role)
         import uuid
-        dev_user_id = os.getenv("DEV_USER_ID", "00000000-0000-0000-0000-000000000001")
+        dev_user_id = os.getenv("DEV_USER_ID", DEV_USER_ID)
         try:
             # Validate it's a valid UUID
             uuid.UUID(dev_user_id)
         except ValueError:
             # If invalid, use the default
-            dev_user_id = "00000000-0000-0000-0000-000000000001"
+            dev_user_id = DEV_USER_ID
         
         logger.info("Using default dev user (teacher role)")
         return UserContext(
@@ -9,7 +9,13 @@ Provides helper functions for:
 """
 
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import base64
+import uuid
+from datetime import datetime, timezone
+import orjson
+from typing import List, Dict, Any, Optional, FrozenSet, Tuple
+from cachetools import TTLCache, cached
 from supabase import Client
 import os
 
@@ -56,6 +62,36 @@ def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def _fetch_teacher_students(teacher_id: str) -> List[Dict[str, Any]]:
+    """Teacher → Classes → Students lookup behind get_teacher_students. Raises on Supabase errors."""
+    # Step 1: Get all classes taught by this teacher
+    teacher_classes_result = supabase.table("teacher_class").select("class_id").eq("teacher_id", teacher_id).execute()
+    class_ids = [tc["class_id"] for tc in (teacher_classes_result.data or [])]
+    
+    if not class_ids:
+        logger.info(f"Teacher {teacher_id} teaches no classes, no students to return")
+        return []
+    
+    logger.info(f"Teacher {teacher_id} teaches {len(class_ids)} classes")
+    
+    # Step 2: Get all students enrolled in these classes
+    enrollments_result = supabase.table("student_class").select("student_id").in_("class_id", class_ids).execute()
+    student_ids = list(set([e["student_id"] for e in (enrollments_result.data or [])]))  # Remove duplicates
+    
+    if not student_ids:
+        logger.info(f"No students enrolled in teacher {teacher_id}'s classes")
+        return []
+    
+    logger.info(f"Found {len(student_ids)} unique students in teacher {teacher_id}'s classes")
+    
+    # Step 3: Get full student profiles
+    students_result = supabase.table("profiles").select("*").in_("id", student_ids).eq("role", "student").execute()
+    students = students_result.data if students_result.data else []
+    
+    logger.info(f"✓ Retrieved {len(students)} student profiles for teacher {teacher_id}")
+    return students
+
+
 def get_teacher_students(teacher_id: str) -> List[Dict[str, Any]]:
     """Get all students enrolled in classes taught by a teacher (class-based linking).
     
@@ -66,37 +102,48 @@ def get_teacher_students(teacher_id: str) -> List[Dict[str, Any]]:
         return []
     
     try:
-        # Step 1: Get all classes taught by this teacher
-        teacher_classes_result = supabase.table("teacher_class").select("class_id").eq("teacher_id", teacher_id).execute()
-        class_ids = [tc["class_id"] for tc in (teacher_classes_result.data or [])]
-        
-        if not class_ids:
-            logger.info(f"Teacher {teacher_id} teaches no classes, no students to return")
-            return []
-        
-        logger.info(f"Teacher {teacher_id} teaches {len(class_ids)} classes")
-        
-        # Step 2: Get all students enrolled in these classes
-        enrollments_result = supabase.table("student_class").select("student_id").in_("class_id", class_ids).execute()
-        student_ids = list(set([e["student_id"] for e in (enrollments_result.data or [])]))  # Remove duplicates
-        
-        if not student_ids:
-            logger.info(f"No students enrolled in teacher {teacher_id}'s classes")
-            return []
-        
-        logger.info(f"Found {len(student_ids)} unique students in teacher {teacher_id}'s classes")
-        
-        # Step 3: Get full student profiles
-        students_result = supabase.table("profiles").select("*").in_("id", student_ids).eq("role", "student").execute()
-        students = students_result.data if students_result.data else []
-        
-        logger.info(f"✓ Retrieved {len(students)} student profiles for teacher {teacher_id}")
-        return students
+        return _fetch_teacher_students(teacher_id)
     except Exception as e:
         logger.error(f"Error fetching teacher students: {e}", exc_info=True)
         return []
 
 
+# teacher_id -> list of student profiles
+_teacher_students_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+_teacher_students_cache_lock = threading.Lock()
+
+
+def get_teacher_students_cached(teacher_id: str) -> List[Dict[str, Any]]:
+    """Cached get_teacher_students (30s TTL); errors are not cached.
+    
+    Used on the grading path to skip the teacher → classes → students round-trips
+    on repeated calls. Call invalidate_teacher_students_cache() when enrollments change.
+    """
+    if not supabase:
+        return []
+    
+    with _teacher_students_cache_lock:
+        students = _teacher_students_cache.get(teacher_id)
+    if students is None:
+        try:
+            students = _fetch_teacher_students(teacher_id)
+        except Exception as e:
+            logger.error(f"Error fetching teacher students: {e}", exc_info=True)
+            return []
+        with _teacher_students_cache_lock:
+            _teacher_students_cache[teacher_id] = students
+    return students
+
+
+def invalidate_teacher_students_cache(teacher_id: Optional[str] = None) -> None:
+    """Drop cached teacher-student linkage for one teacher, or for everyone if teacher_id is None."""
+    with _teacher_students_cache_lock:
+        if teacher_id is None:
+            _teacher_students_cache.clear()
+        else:
+            _teacher_students_cache.pop(teacher_id, None)
+
+
 def get_student_assignments(student_id: str, class_id: Optional[str] = None) -> List[Dict[str, Any]]:
     """Get assignments visible to a student (class-based only).
     
@@ -210,11 +257,49 @@ def get_teacher_assignments(teacher_id: str, class_id: Optional[str] = None) ->
         return []
 
 
-def get_teacher_submissions(teacher_id: str, assignment_id: Optional[str] = None) -> List[Dict[str, Any]]:
-    """Get submissions from students enrolled in classes taught by this teacher (class-based).
+def _teacher_submissions_query(teacher_id: str, assignment_id: Optional[str], columns: str, **select_kwargs):
+    """Build a submissions query scoped to this teacher's students and assignments.
     
     Flow: Teacher → Classes → Students → Submissions
-    Only returns submissions for assignments created by this teacher.
+    Ownership is enforced by an ``assignments!inner`` embed filtered on
+    ``assignments.teacher_id``, so no separate assignments lookup is needed.
+    Returns None when the teacher has no students (nothing can match).
+    """
+    student_ids = [s["id"] for s in get_teacher_students_cached(teacher_id)]
+    logger.info(f"   Found {len(student_ids)} students in teacher's classes")
+    if not student_ids:
+        logger.info(f"   No students in teacher {teacher_id}'s classes")
+        return None
+    
+    query = supabase.table("submissions").select(columns, **select_kwargs)
+    query = query.in_("student_id", student_ids).eq("assignments.teacher_id", teacher_id)
+    if assignment_id:
+        query = query.eq("assignment_id", assignment_id)
+    return query
+
+
+def count_teacher_submissions(teacher_id: str, assignment_id: Optional[str] = None) -> int:
+    """Count submissions from students in this teacher's classes.
+    
+    Uses a HEAD request with ``count="exact"`` so no rows are transferred.
+    """
+    if not supabase:
+        return 0
+    
+    try:
+        query = _teacher_submissions_query(teacher_id, assignment_id, "id, assignments!inner(id)", count="exact", head=True)
+        if query is None:
+            return 0
+        result = query.execute()
+        return result.count or 0
+    except Exception as e:
+        logger.error(f"❌ Error counting teacher submissions: {e}", exc_info=True)
+        return 0
+
+
+def get_teacher_submissions_full(teacher_id: str, assignment_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Get full submission rows (with assignment and student profile) from students
+    enrolled in classes taught by this teacher, for assignments created by this teacher.
     """
     if not supabase:
         return []
@@ -222,43 +307,10 @@ def get_teacher_submissions(teacher_id: str, assignment_id: Optional[str] = None
     try:
         logger.info(f"🔍 Fetching submissions for teacher {teacher_id} (class-based)")
         
-        # Get all student IDs enrolled in teacher's classes
-        students = get_teacher_students(teacher_id)
-        student_ids = [s["id"] for s in students]
-        
-        logger.info(f"   Found {len(student_ids)} students in teacher's classes")
-        
-        if not student_ids:
-            logger.info(f"   No students in teacher {teacher_id}'s classes, returning empty list")
+        query = _teacher_submissions_query(teacher_id, assignment_id, "*, assignments!inner(*), profiles(*)")
+        if query is None:
             return []
         
-        # Get assignments created by this teacher (to ensure we only show submissions to teacher's assignments)
-        assignments_result = supabase.table("assignments").select("id").eq("teacher_id", teacher_id).execute()
-        teacher_assignment_ids = [a["id"] for a in (assignments_result.data or [])]
-        
-        if not teacher_assignment_ids:
-            logger.info(f"   Teacher {teacher_id} has no assignments, no submissions to show")
-            return []
-        
-        logger.info(f"   Teacher has {len(teacher_assignment_ids)} assignments")
-        
-        # Build query: submissions from students in teacher's classes AND for teacher's assignments
-        query = supabase.table("submissions").select("*, assignments(*), profiles(*)")
-        
-        # Filter by student IDs (only students enrolled in teacher's classes)
-        query = query.in_("student_id", student_ids)
-        
-        # Filter by assignment IDs (only assignments created by this teacher)
-        query = query.in_("assignment_id", teacher_assignment_ids)
-        
-        # If specific assignment requested, add that filter too
-        if assignment_id:
-            if assignment_id in teacher_assignment_ids:
-                query = query.eq("assignment_id", assignment_id)
-            else:
-                logger.warning(f"Assignment {assignment_id} not found for teacher {teacher_id}")
-                return []
-        
         result = query.execute()
         submissions = result.data if result.data else []
         
@@ -545,6 +597,58 @@ def get_teacher_classes(teacher_id: str) -> List[Dict[str, Any]]:
         return []
 
 
+def get_teacher_class_ids(teacher_id: str) -> Optional[FrozenSet[str]]:
+    """Get the ids of all classes taught by a teacher (None on error)."""
+    if not supabase:
+        return None
+    
+    try:
+        result = supabase.table("teacher_class").select("class_id").eq("teacher_id", teacher_id).execute()
+        return frozenset(row["class_id"] for row in (result.data or []))
+    except Exception as e:
+        logger.error(f"Error fetching teacher class ids: {e}", exc_info=True)
+        return None
+
+
+# teacher_id -> frozenset of class ids, for "does this teacher teach this class?" checks
+_teacher_class_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_teacher_class_cache_lock = threading.Lock()
+
+
+def get_teacher_class_ids_cached(teacher_id: str) -> FrozenSet[str]:
+    """Cached get_teacher_class_ids (60s TTL); errors are not cached.
+    
+    Call invalidate_teacher_classes_cache() when teacher-class assignments change.
+    """
+    with _teacher_class_cache_lock:
+        class_ids = _teacher_class_cache.get(teacher_id)
+    if class_ids is None:
+        class_ids = get_teacher_class_ids(teacher_id)
+        if class_ids is None:
+            return frozenset()
+        with _teacher_class_cache_lock:
+            _teacher_class_cache[teacher_id] = class_ids
+    return class_ids
+
+
+def teacher_owns_class(teacher_id: str, class_id: str) -> bool:
+    """Check a class against the teacher's cached class ids.
+    
+    Never fetches the full class rows (get_teacher_classes): the id set comes from one
+    id-only teacher_class query per teacher per minute and answers every later check.
+    """
+    return class_id in get_teacher_class_ids_cached(teacher_id)
+
+
+def invalidate_teacher_classes_cache(teacher_id: Optional[str] = None) -> None:
+    """Drop cached class ids for one teacher, or for everyone if teacher_id is None."""
+    with _teacher_class_cache_lock:
+        if teacher_id is None:
+            _teacher_class_cache.clear()
+        else:
+            _teacher_class_cache.pop(teacher_id, None)
+
+
 def get_student_classes(student_id: str) -> List[Dict[str, Any]]:
     """Get all classes a student is enrolled in."""
     if not supabase:
@@ -658,6 +762,25 @@ def is_student_enrolled(student_id: str, class_id: str) -> bool:
         return False
 
 
+def enroll_student_by_code(student_id: str, class_code: str) -> Optional[Dict[str, Any]]:
+    """Look up a class by code and enroll the student in one round-trip.
+    
+    Calls the ``enroll_by_code`` SQL function (see migration_add_enroll_by_code.sql).
+    Returns None if no class has this code, otherwise a dict with ``class_id``,
+    ``class_name``, ``class_code`` and ``inserted`` (False if already enrolled).
+    """
+    if not supabase:
+        logger.error("❌ Supabase not configured, cannot enroll student in class")
+        return None
+    
+    try:
+        result = supabase.rpc("enroll_by_code", {"student_uuid": student_id, "enroll_code": class_code}).execute()
+        return result.data[0] if result.data else None
+    except Exception as e:
+        logger.error(f"❌ Error enrolling student by code: {e}", exc_info=True)
+        return None
+
+
 def create_submission_in_db(
     assignment_id: str,
     student_id: str,
@@ -692,49 +815,127 @@ def create_submission_in_db(
         return None
 
 
-def update_submission_grade(
-    submission_id: str,
-    grade: float,
-    grade_reason: str,
-    plagiarism_score: Optional[float] = None,
-    web_sources: Optional[List[Dict[str, Any]]] = None,
-    academic_sources: Optional[List[Dict[str, Any]]] = None
+def dump_json_text(value: Any) -> str:
+    """Serialize a value to a compact JSON string with orjson (e.g. source lists stored as text)."""
+    return orjson.dumps(value).decode("utf-8")
+
+
+def bulk_update_submission_grades(rows: List[Dict[str, Any]]) -> List[str]:
+    """Update grades for many submissions in one round-trip.
+    
+    Each row has ``id``, ``grade``, ``grade_reason`` and optionally ``plagiarism_score``,
+    ``web_sources`` and ``academic_sources`` (None keeps the stored value).
+    Calls the ``bulk_update_submission_grades`` SQL function
+    (see migration_add_bulk_grade_update.sql) and returns the IDs that were updated.
+    """
+    if not supabase:
+        logger.warning("Supabase not configured, cannot update grades")
+        return []
+    
+    try:
+        payload = []
+        for row in rows:
+            item = dict(row)
+            # Sources are stored as JSON strings
+            for key in ("web_sources", "academic_sources"):
+                if isinstance(item.get(key), list):
+                    item[key] = dump_json_text(item[key])
+            payload.append(item)
+        
+        result = supabase.rpc("bulk_update_submission_grades", {"payload": payload}).execute()
+        updated_ids = [r["id"] for r in (result.data or [])]
+        logger.info(f"✓ Updated grades for {len(updated_ids)}/{len(rows)} submissions")
+        return updated_ids
+    except Exception as e:
+        logger.error(f"❌ Error bulk updating submission grades: {e}", exc_info=True)
+        return []
+
+
+# ============================================================
+# GRADING JOB FUNCTIONS
+# ============================================================
+
+def create_grading_job(assignment_id: str, teacher_id: str) -> Optional[str]:
+    """Create a grading job row with status 'running' and return its ID."""
+    if not supabase:
+        logger.error("❌ Supabase not configured, cannot create grading job")
+        return None
+    
+    try:
+        result = supabase.table("grading_jobs").insert({
+            "assignment_id": assignment_id,
+            "teacher_id": teacher_id,
+            "status": "running"
+        }).execute()
+        
+        if result.data and len(result.data) > 0:
+            job_id = result.data[0]["id"]
+            logger.info(f"✓ Grading job created with ID: {job_id}")
+            return job_id
+        else:
+            logger.error("❌ No data returned from grading job insertion")
+            return None
+    except Exception as e:
+        logger.error(f"❌ Error creating grading job: {e}", exc_info=True)
+        return None
+
+
+def update_grading_job(
+    job_id: str,
+    status: str,
+    graded_count: Optional[int] = None,
+    failed_count: Optional[int] = None,
+    message: Optional[str] = None,
+    error: Optional[str] = None,
+    only_if_running: bool = False
 ) -> bool:
-    """Update submission with grade, plagiarism score, and source attribution."""
+    """Update a grading job's status and result counters.
+    
+    With ``only_if_running=True`` the row is only touched while its status is still
+    'running', so a job that already finished (or was failed as stale) keeps its
+    final status. Returns False when no row was updated.
+    """
     if not supabase:
-        logger.warning("Supabase not configured, cannot update grade")
+        logger.warning("Supabase not configured, cannot update grading job")
         return False
     
     try:
-        import json
         update_data: Dict[str, Any] = {
-            "grade": grade,
-            "grade_reason": grade_reason
+            "status": status,
+            "updated_at": datetime.now(timezone.utc).isoformat()
         }
-        if plagiarism_score is not None:
-            update_data["plagiarism_score"] = plagiarism_score
-        
-        # Add source attribution if provided (store as JSON strings)
-        if web_sources:
-            update_data["web_sources"] = json.dumps(web_sources) if isinstance(web_sources, list) else web_sources
-            logger.info(f"   Including {len(web_sources)} web sources")
-        if academic_sources:
-            update_data["academic_sources"] = json.dumps(academic_sources) if isinstance(academic_sources, list) else academic_sources
-            logger.info(f"   Including {len(academic_sources)} academic sources")
-        
-        result = supabase.table("submissions").update(update_data).eq("id", submission_id).execute()
-        
-        if result.data:
-            logger.info(f"✓ Updated grade for submission {submission_id}: {grade}")
-            return True
-        else:
-            logger.warning(f"⚠ No data returned when updating submission {submission_id}")
-            return False
+        if graded_count is not None:
+            update_data["graded_count"] = graded_count
+        if failed_count is not None:
+            update_data["failed_count"] = failed_count
+        if message is not None:
+            update_data["message"] = message
+        if error is not None:
+            update_data["error"] = error
+        
+        query = supabase.table("grading_jobs").update(update_data).eq("id", job_id)
+        if only_if_running:
+            query = query.eq("status", "running")
+        result = query.execute()
+        return result.data is not None and len(result.data) > 0
     except Exception as e:
-        logger.error(f"❌ Error updating submission grade: {e}", exc_info=True)
+        logger.error(f"❌ Error updating grading job {job_id}: {e}", exc_info=True)
         return False
 
 
+def get_grading_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Get a grading job by ID."""
+    if not supabase:
+        return None
+    
+    try:
+        result = supabase.table("grading_jobs").select("*").eq("id", job_id).execute()
+        return result.data[0] if result.data else None
+    except Exception as e:
+        logger.error(f"Error fetching grading job: {e}")
+        return None
+
+
 def create_user_profile(
     email: str,
     name: str,
@@ -856,6 +1057,19 @@ def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def get_users_by_emails(emails: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Get user profiles for several emails in one query, keyed by email."""
+    if not supabase or not emails:
+        return {}
+    
+    try:
+        result = supabase.table("profiles").select("*").in_("email", emails).execute()
+        return {u["email"]: u for u in (result.data or [])}
+    except Exception as e:
+        logger.error(f"Error fetching users by email: {e}")
+        return {}
+
+
 def find_teacher_by_email(teacher_email: str) -> Optional[Dict[str, Any]]:
     """Find a teacher profile by email (for linking students to teachers)."""
     if not supabase:
@@ -889,27 +1103,102 @@ def get_all_users(role: Optional[str] = None) -> List[Dict[str, Any]]:
         return []
 
 
+def _embedded_count(row: Dict[str, Any], relation: str) -> int:
+    """Pop a PostgREST embedded ``relation(count)`` aggregate (``[{"count": n}]``) off a row."""
+    embedded = row.pop(relation, None) or [{}]
+    return embedded[0].get("count", 0)
+
+
+def _fetch_all_classes() -> List[Dict[str, Any]]:
+    """All classes with teacher/student counts, behind get_all_classes. Raises on Supabase errors."""
+    # Counts are aggregated in the same query instead of one lookup per class
+    result = supabase.table("classes").select("*, teacher_class(count), student_class(count)").order("created_at", desc=True).execute()
+    classes = result.data if result.data else []
+    for cls in classes:
+        cls["teacher_count"] = _embedded_count(cls, "teacher_class")
+        cls["student_count"] = _embedded_count(cls, "student_class")
+    return classes
+
+
 def get_all_classes() -> List[Dict[str, Any]]:
-    """Get all classes (Admin only)."""
+    """Get all classes with teacher/student counts (Admin only)."""
     if not supabase:
         return []
     
     try:
-        result = supabase.table("classes").select("*").order("created_at", desc=True).execute()
-        return result.data if result.data else []
+        return _fetch_all_classes()
     except Exception as e:
         logger.error(f"Error fetching all classes: {e}")
         return []
 
 
+def encode_classes_cursor(created_at: str, class_id: str) -> str:
+    """Opaque, URL-safe cursor for the class after which the next page starts."""
+    return base64.urlsafe_b64encode(f"{created_at}|{class_id}".encode("utf-8")).decode("ascii")
+
+
+def decode_classes_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a cursor from encode_classes_cursor into (created_at, class_id).
+    
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        created_at, class_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(class_id))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def get_classes_page(limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Get one page of classes, newest first, with teacher/student counts (Admin only).
+    
+    Pages are keyed on (created_at, id), so classes sharing a timestamp are never
+    skipped. cursor is the next_cursor of the previous page (see encode_classes_cursor).
+    Returns {"classes": [...], "next_cursor": str or None}; next_cursor is None on the
+    last page. Raises ValueError for a malformed cursor and lets database errors propagate.
+    """
+    if not supabase:
+        return {"classes": [], "next_cursor": None}
+    
+    query = supabase.table("classes").select(
+        "id, name, code, description, created_at, teacher_class(count), student_class(count)"
+    ).order("created_at", desc=True).order("id", desc=True).limit(limit)
+    if cursor:
+        created_at, class_id = decode_classes_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{class_id})'
+        )
+    
+    classes = query.execute().data or []
+    for cls in classes:
+        cls["teacher_count"] = _embedded_count(cls, "teacher_class")
+        cls["student_count"] = _embedded_count(cls, "student_class")
+    
+    next_cursor = None
+    if len(classes) == limit:
+        last = classes[-1]
+        next_cursor = encode_classes_cursor(last["created_at"], last["id"])
+    return {"classes": classes, "next_cursor": next_cursor}
+
+
+def _fetch_all_assignments() -> List[Dict[str, Any]]:
+    """All assignments with submission counts, behind get_all_assignments. Raises on Supabase errors."""
+    result = supabase.table("assignments").select("*, submissions(count)").order("created_at", desc=True).execute()
+    assignments = result.data if result.data else []
+    for assignment in assignments:
+        assignment["submission_count"] = _embedded_count(assignment, "submissions")
+    return assignments
+
+
 def get_all_assignments() -> List[Dict[str, Any]]:
-    """Get all assignments (Admin only)."""
+    """Get all assignments with submission counts (Admin only)."""
     if not supabase:
         return []
     
     try:
-        result = supabase.table("assignments").select("*").order("created_at", desc=True).execute()
-        return result.data if result.data else []
+        return _fetch_all_assignments()
     except Exception as e:
         logger.error(f"Error fetching all assignments: {e}")
         return []
@@ -1023,6 +1312,105 @@ def delete_user_profile(user_id: str) -> bool:
         return False
 
 
+# The cached admin helpers call the raising _fetch_* variants: @cached doesn't store
+# a result when the call raises, so a Supabase error reaches the endpoint's 500
+# handler instead of being served as zeros/empty lists until the TTL expires.
+
+@cached(TTLCache(maxsize=1, ttl=30), lock=threading.Lock())
+def get_system_stats_cached() -> Dict[str, Any]:
+    """Cached get_system_stats (30s TTL) - dashboard counts don't need to be real-time. Raises on Supabase errors."""
+    if not supabase:
+        return get_system_stats()
+    return _fetch_system_stats()
+
+
+@cached(TTLCache(maxsize=1, ttl=5), lock=threading.Lock())
+def get_all_classes_cached() -> List[Dict[str, Any]]:
+    """Cached get_all_classes (5s TTL). Call invalidate_admin_cache() when classes change. Raises on Supabase errors."""
+    if not supabase:
+        return []
+    return _fetch_all_classes()
+
+
+@cached(TTLCache(maxsize=1, ttl=5), lock=threading.Lock())
+def get_all_assignments_cached() -> List[Dict[str, Any]]:
+    """Cached get_all_assignments (5s TTL). Call invalidate_admin_cache() when assignments change. Raises on Supabase errors."""
+    if not supabase:
+        return []
+    return _fetch_all_assignments()
+
+
+def invalidate_admin_cache() -> None:
+    """Drop the cached admin stats and class/assignment lists."""
+    get_system_stats_cached.cache_clear()
+    get_all_classes_cached.cache_clear()
+    get_all_assignments_cached.cache_clear()
+
+
+def update_users_role(user_ids: List[str], new_role: str) -> List[str]:
+    """Set the same role on many users in one UPDATE (Admin only). Returns updated IDs."""
+    if not supabase or not user_ids:
+        return []
+    
+    if new_role not in ["admin", "teacher", "student"]:
+        logger.error(f"Invalid role: {new_role}")
+        return []
+    
+    try:
+        result = supabase.table("profiles").update({"role": new_role}).in_("id", user_ids).execute()
+        return [u["id"] for u in (result.data or [])]
+    except Exception as e:
+        logger.error(f"Error updating user roles: {e}")
+        return []
+
+
+def delete_user_profiles(user_ids: List[str]) -> int:
+    """Delete many user profiles in one DELETE (Admin only). Returns number deleted."""
+    if not supabase or not user_ids:
+        return 0
+    
+    try:
+        result = supabase.table("profiles").delete().in_("id", user_ids).execute()
+        return len(result.data or [])
+    except Exception as e:
+        logger.error(f"Error deleting user profiles: {e}")
+        return 0
+
+
+def _fetch_system_stats() -> Dict[str, Any]:
+    """System-wide counts behind get_system_stats. Raises on Supabase errors."""
+    # Get user counts by role
+    users_result = supabase.table("profiles").select("role").execute()
+    users = users_result.data if users_result.data else []
+    user_counts = {"admin": 0, "teacher": 0, "student": 0}
+    for user in users:
+        role = user.get("role", "student")
+        if role in user_counts:
+            user_counts[role] += 1
+    
+    # Get class count
+    classes_result = supabase.table("classes").select("id", count="exact").execute()
+    total_classes = classes_result.count if hasattr(classes_result, 'count') else len(classes_result.data or [])
+    
+    # Get assignment count
+    assignments_result = supabase.table("assignments").select("id", count="exact").execute()
+    total_assignments = assignments_result.count if hasattr(assignments_result, 'count') else len(assignments_result.data or [])
+    
+    # Get submission count
+    submissions_result = supabase.table("submissions").select("id", count="exact").execute()
+    total_submissions = submissions_result.count if hasattr(submissions_result, 'count') else len(submissions_result.data or [])
+    
+    return {
+        "total_users": len(users),
+        "total_teachers": user_counts["teacher"],
+        "total_students": user_counts["student"],
+        "total_admins": user_counts["admin"],
+        "total_classes": total_classes,
+        "total_assignments": total_assignments,
+        "total_submissions": total_submissions
+    }
+
+
 def get_system_stats() -> Dict[str, Any]:
     """Get system-wide statistics (Admin only)."""
     if not supabase:
@@ -1037,36 +1425,7 @@ def get_system_stats() -> Dict[str, Any]:
         }
     
     try:
-        # Get user counts by role
-        users_result = supabase.table("profiles").select("role").execute()
-        users = users_result.data if users_result.data else []
-        user_counts = {"admin": 0, "teacher": 0, "student": 0}
-        for user in users:
-            role = user.get("role", "student")
-            if role in user_counts:
-                user_counts[role] += 1
-        
-        # Get class count
-        classes_result = supabase.table("classes").select("id", count="exact").execute()
-        total_classes = classes_result.count if hasattr(classes_result, 'count') else len(classes_result.data or [])
-        
-        # Get assignment count
-        assignments_result = supabase.table("assignments").select("id", count="exact").execute()
-        total_assignments = assignments_result.count if hasattr(assignments_result, 'count') else len(assignments_result.data or [])
-        
-        # Get submission count
-        submissions_result = supabase.table("submissions").select("id", count="exact").execute()
-        total_submissions = submissions_result.count if hasattr(submissions_result, 'count') else len(submissions_result.data or [])
-        
-        return {
-            "total_users": len(users),
-            "total_teachers": user_counts["teacher"],
-            "total_students": user_counts["student"],
-            "total_admins": user_counts["admin"],
-            "total_classes": total_classes,
-            "total_assignments": total_assignments,
-            "total_submissions": total_submissions
-        }
+        return _fetch_system_stats()
     except Exception as e:
         logger.error(f"Error fetching system stats: {e}")
         return {
@@ -37,6 +37,25 @@ relevance_parser = JsonOutputParser(pydantic_object=AssignmentRelevanceCheck)
 assignment_parser = JsonOutputParser(pydantic_object=AssignmentMaker)
 rubric_parser = JsonOutputParser(pydantic_object=Rubric)
 
+# Build prompt templates (and their format instructions) once instead of on every graph run
+relevance_chain = PromptTemplate(
+    template=relevance_prompt,
+    input_variables=["topic", "context"],
+    partial_variables={"format_instructions": relevance_parser.get_format_instructions()},
+) | model | relevance_parser
+
+assignment_chain = PromptTemplate(
+    template=assignment_prompt,
+    input_variables=["topic", "description", "type", "num_questions"],
+    partial_variables={"format_instructions": assignment_parser.get_format_instructions()},
+) | model | assignment_parser
+
+rubric_chain = PromptTemplate(
+    template=rubric_generator,
+    input_variables=["questions"],
+    partial_variables={"format_instructions": rubric_parser.get_format_instructions()},
+) | model | rubric_parser
+
 # Initialize embeddings (configurable provider)
 provider_info = get_provider_info()
 logger.info(f"Using embedding provider: {provider_info['name']} ({provider_info['provider']})")
@@ -160,15 +179,7 @@ def check_relevance(state: AssignmentCreate):
                 "reasoning": "No context retrieved, allowing assignment creation to proceed"
             }
         
-        prompt = PromptTemplate(
-            template=relevance_prompt,
-            input_variables=["topic", "context"],
-            partial_variables={"format_instructions": relevance_parser.get_format_instructions()},
-        )
-        
-        chain = prompt | model | relevance_parser
-
-        results = chain.invoke({"topic": topic, "context": context})
+        results = relevance_chain.invoke({"topic": topic, "context": context})
         
         logger.info(f"Relevance check completed - Is relevant: {results['is_relevant']}")
         logger.info(f"Reasoning: {results['reasoning']}")
@@ -217,15 +228,7 @@ def create_assignment(state: AssignmentCreate):
     try:
         logger.info(f"Creating assignment for topic: {state['topic']} with {state['num_questions']} questions of type: {state['type']}")
         
-        prompt = PromptTemplate(
-            template=assignment_prompt,
-            input_variables=["topic", "description", "type", "num_questions"],
-            partial_variables={"format_instructions": assignment_parser.get_format_instructions()},
-        )
-
-        chain = prompt | model | assignment_parser
-
-        results = chain.invoke({
+        results = assignment_chain.invoke({
             "topic": state['topic'], 
             "description": state['description'],
             "type": state['type'],
@@ -256,15 +259,7 @@ def rubric_generation(state: AssignmentCreate):
     try:
         logger.info(f"Generating rubric for {len(state['questions'])} questions")
         
-        prompt = PromptTemplate(
-            template=rubric_generator,
-            input_variables=["questions"],
-            partial_variables={"format_instructions": rubric_parser.get_format_instructions()},
-        )
-
-        chain = prompt | model | rubric_parser
-
-        results = chain.invoke({
+        results = rubric_chain.invoke({
             "questions": state['questions']
         })
 
@@ -1,14 +1,16 @@
 from langgraph.graph import START, END, StateGraph
 import logging
-from typing import Optional, List, Dict, Any
+from typing import List, Dict, Any
 from states import AssignmentGrade, Submissions, RubricGrade, SourceMatch
-from supabase import create_client, Client
 from prompts import assignment_grader
+from db_helpers import supabase  # service key bypasses RLS for grading
 import json
 import requests
+from requests.adapters import HTTPAdapter
 import os
 import tempfile
 from pathlib import Path
+from functools import lru_cache
 import fitz  # PyMuPDF
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
@@ -23,19 +25,14 @@ from urllib.parse import quote
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Initialize Supabase client (use service key to bypass RLS for grading)
-SUPABASE_URL = os.getenv("SUPABASE_URL", "")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY", "")
+# If similarity > 40%, set grade to 0
+PLAGIARISM_THRESHOLD = 40.0
 
-supabase: Optional[Client] = None
-if SUPABASE_URL and SUPABASE_SERVICE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-        logger.info("✓ Supabase client initialized for assignment grading (using service key)")
-    except Exception as e:
-        logger.error(f"❌ Could not initialize Supabase client: {e}")
-else:
-    logger.warning("⚠ Supabase not configured - SUPABASE_URL or SUPABASE_SERVICE_KEY not set")
+# Keep-alive HTTP session for submission downloads and web source lookups,
+# so a grading run reuses connections instead of opening one per file
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50))
+http_session.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=50))
 
 # Initialize LLM model (configurable provider: OpenAI or Groq)
 llm_provider_info = get_llm_provider_info()
@@ -57,6 +54,13 @@ except Exception as e:
 
 grading_parser = JsonOutputParser(pydantic_object=RubricGrade)
 
+# Build the grading prompt (and its format instructions) once instead of on every graph run
+grading_prompt = PromptTemplate(
+    template=assignment_grader,
+    input_variables=["questions", "rubric", "submission"],
+    partial_variables={"format_instructions": grading_parser.get_format_instructions()},
+)
+
 def fetch_submission_ids(state: AssignmentGrade):
     """Fetch all submission IDs and file URLs for the given assignment ID from Supabase."""
     logger.info("=" * 60)
@@ -76,7 +80,7 @@ def fetch_submission_ids(state: AssignmentGrade):
         
         # If student_ids are provided, filter to only those students (teacher's linked students)
         student_ids = state.get('student_ids')
-        if student_ids and len(student_ids) > 0:
+        if student_ids:
             logger.info(f"   Filtering to {len(student_ids)} teacher's students")
             query = query.in_('student_id', student_ids)
         else:
@@ -207,7 +211,7 @@ def download_and_parse_files(state: AssignmentGrade):
             
             try:
                 # Download the file
-                response = requests.get(file_url, timeout=30)
+                response = http_session.get(file_url, timeout=30)
                 response.raise_for_status()
                 
                 # Determine file extension from URL or content-type
@@ -259,14 +263,8 @@ def download_and_parse_files(state: AssignmentGrade):
                 os.unlink(temp_file_path)
                 logger.info(f"Temporary file deleted: {temp_file_path}")
                 
-                # Update the submission with file content
-                updated_submission = Submissions(
-                    submission_id=submission_id,
-                    file_url=file_url,
-                    file_content=file_content,
-                    plagerism_score=submission.plagerism_score,
-                    total_score=submission.total_score
-                )
+                # Update the submission with file content (copy skips re-validating unchanged fields)
+                updated_submission = submission.model_copy(update={"file_content": file_content})
                 updated_submissions.append(updated_submission)
                 
                 logger.info(f"Successfully processed submission {submission_id} (content length: {len(file_content)} chars)")
@@ -303,15 +301,12 @@ def grade_submissions(state: AssignmentGrade):
         
         logger.info(f"Starting grading process for {len(submissions)} submission(s)")
         
-        # Create the prompt template
-        prompt = PromptTemplate(
-            template=assignment_grader,
-            input_variables=["questions", "rubric", "submission"],
-            partial_variables={"format_instructions": grading_parser.get_format_instructions()},
-        )
-        
-        # Create the chain
-        chain = prompt | model | grading_parser
+        # Questions and rubric are the same for every submission: render them to text once
+        # per run so each prompt only has to splice in the submission content
+        grading_chain = grading_prompt.partial(
+            questions=str(questions),
+            rubric=str(rubric)
+        ) | model | grading_parser
         
         graded_submissions = []
         
@@ -329,11 +324,7 @@ def grade_submissions(state: AssignmentGrade):
                     continue
                 
                 # Grade the submission
-                result = chain.invoke({
-                    "questions": questions,
-                    "rubric": rubric,
-                    "submission": file_content
-                })
+                result = grading_chain.invoke({"submission": file_content})
                 
                 logger.info(f"Raw grading result type: {type(result)}")
                 logger.info(f"Raw grading result: {result}")
@@ -438,13 +429,7 @@ def grade_submissions(state: AssignmentGrade):
                 logger.info(f"   ✓ Created RubricGrade: total_score={rubric_grade.total_score}, reason_length={len(rubric_grade.reason)}")
                 
                 # Update the submission with the grade
-                graded_submission = Submissions(
-                    submission_id=submission_id,
-                    file_url=submission.file_url,
-                    file_content=file_content,
-                    plagerism_score=submission.plagerism_score,
-                    total_score=rubric_grade
-                )
+                graded_submission = submission.model_copy(update={"total_score": rubric_grade})
                 
                 logger.info(f"   ✓ Updated submission with grade. Submission.total_score type: {type(graded_submission.total_score)}")
                 graded_submissions.append(graded_submission)
@@ -494,8 +479,6 @@ def check_plagiarism(state: AssignmentGrade):
     
     If plagiarism score exceeds threshold (40%), the grade is set to 0.
     """
-    PLAGIARISM_THRESHOLD = 40.0  # If similarity > 40%, set grade to 0
-    
     try:
         submissions = state['submission_ids']
         assignment_id = state['assignment_id']
@@ -528,7 +511,7 @@ def check_plagiarism(state: AssignmentGrade):
                 
             try:
                 # Download the file
-                response = requests.get(file_url, timeout=30)
+                response = http_session.get(file_url, timeout=30)
                 response.raise_for_status()
                 
                 # Parse as text (we already know these are .txt files)
@@ -537,19 +520,17 @@ def check_plagiarism(state: AssignmentGrade):
             except Exception as e:
                 logger.warning(f"   Could not download submission {sub_id} for plagiarism check: {e}")
         
+        # Split every submission into its word set once, instead of once per comparison
+        all_submission_words = {
+            sub_id: text_word_set(content)
+            for sub_id, content in all_submission_contents.items()
+            if content
+        }
+        
         if len(all_submission_contents) < 2:
             logger.info("Less than 2 submissions with content - skipping plagiarism check")
             # Set plagiarism to 0 for all submissions
-            updated_submissions = []
-            for sub in submissions:
-                updated_submission = Submissions(
-                    submission_id=sub.submission_id,
-                    file_url=sub.file_url,
-                    file_content=sub.file_content,
-                    plagerism_score=0.0,
-                    total_score=sub.total_score
-                )
-                updated_submissions.append(updated_submission)
+            updated_submissions = [sub.model_copy(update={"plagerism_score": 0.0}) for sub in submissions]
             return {"submission_ids": updated_submissions}
         
         updated_submissions = []
@@ -561,28 +542,19 @@ def check_plagiarism(state: AssignmentGrade):
             current_content = current_submission.file_content
             if not current_content:
                 logger.warning(f"Submission {current_submission.submission_id} has no content - setting plagiarism score to 0")
-                updated_submission = Submissions(
-                    submission_id=current_submission.submission_id,
-                    file_url=current_submission.file_url,
-                    file_content=current_submission.file_content,
-                    plagerism_score=0.0,
-                    total_score=current_submission.total_score
-                )
-                updated_submissions.append(updated_submission)
+                updated_submissions.append(current_submission.model_copy(update={"plagerism_score": 0.0}))
                 continue
             
             max_similarity = 0.0
+            current_words = text_word_set(current_content)
             
             # Compare with ALL submissions for the assignment (not just teacher's students)
-            for other_sub_id, other_content in all_submission_contents.items():
+            for other_sub_id, other_words in all_submission_words.items():
                 if other_sub_id == current_submission.submission_id:  # Skip comparing with itself
                     continue
                 
-                if not other_content:
-                    continue
-                
                 # Calculate simple similarity based on common words
-                similarity = calculate_text_similarity(current_content, other_content)
+                similarity = word_set_similarity(current_words, other_words)
                 max_similarity = max(max_similarity, similarity)
                 logger.debug(f"   Similarity with submission {other_sub_id}: {similarity * 100:.2f}%")
             
@@ -609,20 +581,19 @@ def check_plagiarism(state: AssignmentGrade):
             
             # Update plagiarism score if web/academic sources show high similarity
             if web_sources:
-                max_web_similarity = max([s.similarity for s in web_sources])
+                max_web_similarity = max(s.similarity for s in web_sources)
                 if max_web_similarity > plagiarism_percentage:
                     logger.info(f"   Higher similarity found in web sources: {max_web_similarity}%")
                     plagiarism_percentage = max_web_similarity
             
             if academic_sources:
-                max_academic_similarity = max([s.similarity for s in academic_sources])
+                max_academic_similarity = max(s.similarity for s in academic_sources)
                 if max_academic_similarity > plagiarism_percentage:
                     logger.info(f"   Higher similarity found in academic sources: {max_academic_similarity}%")
                     plagiarism_percentage = max_academic_similarity
             
             # Get the current grade
             current_grade = current_submission.total_score
-            PLAGIARISM_THRESHOLD = 40.0  # If similarity > 40%, set grade to 0
             
             logger.info(f"   Current grade before plagiarism check: {current_grade.total_score if current_grade and hasattr(current_grade, 'total_score') else 'None'}")
             logger.info(f"   Final plagiarism score: {plagiarism_percentage}% (includes web/academic sources), Threshold: {PLAGIARISM_THRESHOLD}%")
@@ -650,15 +621,12 @@ def check_plagiarism(state: AssignmentGrade):
                 logger.info(f"   ✓ Plagiarism {plagiarism_percentage}% is below threshold - keeping original grade")
             
             # Update submission with plagiarism score, source attribution, and potentially modified grade
-            updated_submission = Submissions(
-                submission_id=current_submission.submission_id,
-                file_url=current_submission.file_url,
-                file_content=current_submission.file_content,
-                plagerism_score=plagiarism_percentage,
-                total_score=current_grade,
-                web_sources=web_sources if web_sources else None,
-                academic_sources=academic_sources if academic_sources else None
-            )
+            updated_submission = current_submission.model_copy(update={
+                "plagerism_score": plagiarism_percentage,
+                "total_score": current_grade,
+                "web_sources": web_sources if web_sources else None,
+                "academic_sources": academic_sources if academic_sources else None
+            })
             
             # Verify the grade was set correctly
             final_grade = updated_submission.total_score
@@ -692,24 +660,24 @@ def check_plagiarism(state: AssignmentGrade):
             "submission_ids": state['submission_ids']
         }
 
-def calculate_text_similarity(text1: str, text2: str) -> float:
+def text_word_set(text: str) -> frozenset:
+    """Normalize a text for similarity checks: lowercase and split into a set of words."""
+    return frozenset(text.lower().split())
+
+
+def word_set_similarity(words1: frozenset, words2: frozenset) -> float:
     """
-    Calculate similarity between two texts using Jaccard similarity.
+    Jaccard similarity of two word sets (see text_word_set).
     Returns a value between 0 and 1.
     """
-    # Normalize texts: lowercase and split into words
-    words1 = set(text1.lower().split())
-    words2 = set(text2.lower().split())
+    # |A ∪ B| = |A| + |B| - |A ∩ B|, so the union set never has to be built
+    intersection = len(words1 & words2)
+    union = len(words1) + len(words2) - intersection
     
-    # Calculate Jaccard similarity: intersection / union
-    intersection = words1.intersection(words2)
-    union = words1.union(words2)
-    
-    if len(union) == 0:
+    if union == 0:
         return 0.0
     
-    similarity = len(intersection) / len(union)
-    return similarity
+    return intersection / union
 
 
 def check_web_sources(text: str, max_results: int = 5) -> List[SourceMatch]:
@@ -718,6 +686,9 @@ def check_web_sources(text: str, max_results: int = 5) -> List[SourceMatch]:
     Returns list of matched sources with URLs and similarity scores.
     """
     try:
+        # Word set of the submission, shared by every result comparison below
+        text_words = text_word_set(text)
+        
         # Extract key phrases from text (first 200 chars for search query)
         search_query = text[:200].strip()
         if len(search_query) < 20:
@@ -742,7 +713,7 @@ def check_web_sources(text: str, max_results: int = 5) -> List[SourceMatch]:
                     "api_key": serpapi_key,
                     "num": max_results
                 }
-                response = requests.get(serpapi_url, params=params, timeout=10)
+                response = http_session.get(serpapi_url, params=params, timeout=10)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -756,7 +727,7 @@ def check_web_sources(text: str, max_results: int = 5) -> List[SourceMatch]:
                             
                             if url:
                                 combined_text = (title + " " + snippet).lower()
-                                similarity = calculate_text_similarity(text.lower(), combined_text)
+                                similarity = word_set_similarity(text_words, text_word_set(combined_text))
                                 
                                 if similarity > 0.1:
                                     web_sources.append(SourceMatch(
@@ -775,7 +746,7 @@ def check_web_sources(text: str, max_results: int = 5) -> List[SourceMatch]:
         try:
             ddg_url = f"https://html.duckduckgo.com/html/?q={quote(search_query)}"
             headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-            response = requests.get(ddg_url, headers=headers, timeout=10)
+            response = http_session.get(ddg_url, headers=headers, timeout=10)
             
             if response.status_code == 200:
                 try:
@@ -803,7 +774,7 @@ def check_web_sources(text: str, max_results: int = 5) -> List[SourceMatch]:
                         title = result.get_text(strip=True)
                         
                         if url and title:
-                            similarity = calculate_text_similarity(text.lower(), title.lower())
+                            similarity = word_set_similarity(text_words, text_word_set(title))
                             if similarity > 0.1:
                                 web_sources.append(SourceMatch(
                                     url=url,
@@ -841,6 +812,29 @@ def check_web_sources(text: str, max_results: int = 5) -> List[SourceMatch]:
         return []
 
 
+@lru_cache(maxsize=1)
+def get_academic_store() -> QdrantVectorStore:
+    """
+    Connect to the Qdrant knowledge base used for academic source checks.
+    
+    Built on first use and reused for every submission afterwards: loading the
+    embedding models and opening the connection is far slower than a search.
+    A failed connection raises and is not cached, so the next call retries.
+    """
+    dense_embeddings = get_embeddings()
+    sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+    
+    return QdrantVectorStore.from_existing_collection(
+        collection_name="teachmate",
+        embedding=dense_embeddings,
+        sparse_embedding=sparse_embeddings,
+        retrieval_mode=RetrievalMode.HYBRID,
+        url=QDRANT_URL,
+        api_key=QDRANT_API_KEY,
+        prefer_grpc=True,
+    )
+
+
 def check_academic_sources(text: str, max_results: int = 5) -> List[SourceMatch]:
     """
     Check submission text against academic sources in Qdrant knowledge base.
@@ -854,29 +848,19 @@ def check_academic_sources(text: str, max_results: int = 5) -> List[SourceMatch]
         logger.info(f"   📚 Searching academic sources in Qdrant knowledge base...")
         
         try:
-            dense_embeddings = get_embeddings()
-            sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
-            
-            qdrant = QdrantVectorStore.from_existing_collection(
-                collection_name="teachmate",
-                embedding=dense_embeddings,
-                sparse_embedding=sparse_embeddings,
-                retrieval_mode=RetrievalMode.HYBRID,
-                url=QDRANT_URL,
-                api_key=QDRANT_API_KEY,
-                prefer_grpc=True,
-            )
+            qdrant = get_academic_store()
             
             # Search for similar content
             results = qdrant.similarity_search(text, k=max_results)
             
+            text_words = text_word_set(text)
             academic_sources = []
             for doc in results:
                 metadata = doc.metadata if hasattr(doc, 'metadata') else {}
                 source_url = metadata.get('source', metadata.get('url', 'knowledge_base'))
                 title = metadata.get('title', 'Academic Source')
                 
-                similarity = calculate_text_similarity(text.lower(), doc.page_content.lower())
+                similarity = word_set_similarity(text_words, text_word_set(doc.page_content))
                 
                 if similarity > 0.1:
                     academic_sources.append(SourceMatch(
@@ -9,14 +9,17 @@ Endpoints:
 - /admin/* (admin) - Admin endpoints
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response, JSONResponse
-import csv
+from fastapi.responses import Response, JSONResponse, ORJSONResponse
 import io
-from datetime import datetime
+import re
+from datetime import datetime, timedelta, timezone
+from aiodataloader import DataLoader
+from cachetools import TTLCache
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, FrozenSet
+import asyncio
 import logging
 import uvicorn
 import os
@@ -29,22 +32,28 @@ except ImportError:
     pass  # python-dotenv not installed, skip
 
 from features.assignment_create import assignment_creator_graph
-from features.assignment_grade import assignment_grader_graph
-from auth import get_current_user, UserContext, require_role
+from features.assignment_grade import assignment_grader_graph, PLAGIARISM_THRESHOLD
+from auth import get_current_user, UserContext, DEV_USER_ID, DEV_USER_IDS
 from audit import log_assignment_creation, log_submission, log_action
 from db_helpers import (
     get_teacher_assignments, get_student_assignments,
-    get_teacher_submissions, get_student_submissions,
+    get_teacher_submissions_full, get_student_submissions,
     create_assignment_in_db, create_submission_in_db,
-    get_user_profile, create_user_profile, get_user_by_email,
-    find_teacher_by_email, update_submission_grade, get_teacher_students,
+    get_user_profile, create_user_profile, get_user_by_email, get_users_by_emails,
+    find_teacher_by_email, bulk_update_submission_grades,
+    get_teacher_students_cached, invalidate_teacher_students_cache,
+    get_teacher_class_ids_cached, invalidate_teacher_classes_cache,
+    get_system_stats_cached, get_all_classes_cached, get_all_assignments_cached, invalidate_admin_cache,
     update_assignment_in_db, delete_assignment_in_db,
     create_class, assign_teacher_to_class, enroll_student_in_class,
     get_teacher_classes, get_student_classes, get_class_students, get_class_teachers,
-    get_class_by_code, is_student_enrolled,
-    get_all_users, get_all_classes, get_all_assignments, get_all_submissions,
-    get_system_stats, update_user_role, assign_teacher_to_class_admin,
+    enroll_student_by_code,
+    get_all_users, get_classes_page, decode_classes_cursor, get_all_submissions,
+    update_user_role, assign_teacher_to_class_admin,
     enroll_student_in_class_admin, remove_user_from_class, delete_user_profile,
+    update_users_role, delete_user_profiles,
+    create_grading_job, update_grading_job, get_grading_job,
+    count_teacher_submissions,
     supabase as db_supabase
 )
 from analytics_helpers import get_assignment_analytics, get_overall_analytics
@@ -53,6 +62,37 @@ from analytics_helpers import get_assignment_analytics, get_overall_analytics
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# ============================================================
+# CONSTANTS
+# ============================================================
+
+# Column order of the grades CSV export
+CSV_HEADER = (
+    "Student Name",
+    "Roll Number",
+    "Assignment Title",
+    "Grade",
+    "Plagiarism Score (%)",
+    "Grade Reason",
+    "Submission Date",
+    "File URL",
+)
+
+LOG_BANNER = "=" * 80
+
+# A grading job still 'running' this long after its last update is treated as lost
+# (background tasks don't survive a worker restart)
+GRADING_JOB_STALE_AFTER = timedelta(minutes=30)
+
+# How often a running grading job refreshes updated_at while it works
+GRADING_JOB_HEARTBEAT_INTERVAL = timedelta(minutes=1)
+
+# Characters not allowed in download filenames
+_TITLE_RE = re.compile(r"[^A-Za-z0-9 _-]")
+
+# Accepted class codes, e.g. "MATH-101" (max 50 chars)
+_CLASS_CODE_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9 _.-]{0,49}")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="TeachMate Assignment Creator API (RBAC)",
@@ -145,6 +185,120 @@ class LoginResponse(BaseModel):
     token: Optional[str] = None
     error: Optional[str] = None
 
+class RoleUpdate(BaseModel):
+    user_id: str = Field(..., description="ID of user to update")
+    new_role: str = Field(..., description="New role: 'admin', 'teacher', or 'student'")
+
+class BulkRoleUpdateRequest(BaseModel):
+    updates: List[RoleUpdate] = Field(..., description="Role changes to apply")
+
+class BulkDeleteUsersRequest(BaseModel):
+    user_ids: List[str] = Field(..., description="IDs of users to delete")
+
+# ============================================================
+# RESPONSE HELPERS
+# ============================================================
+
+def ok(**extra) -> Dict[str, Any]:
+    """Build a {"success": True, ...} response body."""
+    extra["success"] = True
+    return extra
+
+
+def ok_list(key: str, items: List[Any]) -> Dict[str, Any]:
+    """Build a {"success": True, key: items, "count": n} response body."""
+    return {"success": True, key: items, "count": len(items)}
+
+
+# ============================================================
+# DEPENDENCIES
+# ============================================================
+
+async def _load_users_by_email(emails: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """DataLoader batch function: one profiles query for every email requested in the same tick."""
+    users = await asyncio.to_thread(get_users_by_emails, list(emails))
+    return [users.get(email) for email in emails]
+
+_user_by_email_loader: Optional[DataLoader] = None
+
+def get_user_by_email_loader() -> DataLoader:
+    """Return the shared email loader, created lazily on the running event loop.
+    
+    Resolved users are kept for 60s, so repeated requests skip the lookup entirely.
+    """
+    global _user_by_email_loader
+    if _user_by_email_loader is None:
+        _user_by_email_loader = DataLoader(
+            batch_load_fn=_load_users_by_email,
+            cache_map=TTLCache(maxsize=1024, ttl=60)
+        )
+    return _user_by_email_loader
+
+async def resolve_actual_user(user: UserContext = Depends(get_current_user)) -> UserContext:
+    """
+    Resolve the real user behind a dev-mode token.
+    
+    When auth is bypassed the token carries a placeholder UUID; look up the actual
+    profile by email so endpoints can use user.user_id directly. FastAPI caches this
+    dependency per request and the email lookup is cached for 60s, so the lookup
+    runs at most once per minute per dev user.
+    """
+    if user.user_id in DEV_USER_IDS:
+        existing_user = await get_user_by_email_loader().load(user.email)
+        if existing_user:
+            logger.debug("Dev mode: resolved %s to user ID %s", user.email, existing_user["id"])
+            return UserContext(
+                user_id=existing_user["id"],
+                email=user.email,
+                role=user.role,
+                name=user.name
+            )
+        logger.warning(f"⚠️ Dev user {user.email} not found in database, using dev UUID")
+    return user
+
+def require_roles(*allowed_roles: str):
+    """
+    Build a dependency that resolves the current user and rejects roles not in allowed_roles.
+    
+    Usage: user: UserContext = Depends(teacher_or_admin)
+    """
+    allowed = frozenset(allowed_roles)
+    detail = "Admin access required" if allowed == {"admin"} else f"Access denied. Required role(s): {', '.join(allowed_roles)}"
+    
+    async def dependency(user: UserContext = Depends(resolve_actual_user)) -> UserContext:
+        if user.role not in allowed:
+            raise HTTPException(status_code=403, detail=detail)
+        return user
+    
+    return dependency
+
+teacher_or_admin = require_roles("teacher", "admin")
+admin_only = require_roles("admin")
+
+def invalidate_user_caches(user_ids: List[str]) -> None:
+    """
+    Drop cached data that depends on these users' roles or existence.
+    
+    Call after changing roles or deleting users: admin stats/lists change, a demoted or
+    deleted teacher must stop passing ownership checks, and teachers' student lists
+    (filtered by role = 'student') may gain or lose members.
+    """
+    invalidate_admin_cache()
+    invalidate_teacher_students_cache()
+    for user_id in user_ids:
+        invalidate_teacher_classes_cache(user_id)
+
+async def load_teacher_class_ids(user: UserContext) -> FrozenSet[str]:
+    """
+    Return the ids of the classes the user teaches, loading them at most once per request.
+    
+    The set is stored on user.teacher_class_ids, so later checks in the same request
+    are plain membership tests; the underlying lookup is also cached for 60s.
+    """
+    if user.teacher_class_ids is None:
+        user.teacher_class_ids = await asyncio.to_thread(get_teacher_class_ids_cached, user.user_id)
+    return user.teacher_class_ids
+
 # ============================================================
 # API ENDPOINTS
 # ============================================================
@@ -244,12 +398,10 @@ async def register(request: RegisterRequest):
             
             # Step 2.5: Auto-confirm email using service role (bypasses email confirmation requirement)
             # This is needed because Supabase Auth requires email confirmation by default
-            service_key = os.getenv("SUPABASE_SERVICE_KEY", "")
-            if service_key:
+            if db_supabase:
                 try:
-                    supabase_admin = create_client(SUPABASE_URL, service_key)
-                    # Update user to confirm email using admin API
-                    updated_user = supabase_admin.auth.admin.update_user_by_id(
+                    # Update user to confirm email using admin API (shared service-role client)
+                    updated_user = db_supabase.auth.admin.update_user_by_id(
                         auth_user_id,
                         {"email_confirm": True}
                     )
@@ -278,10 +430,8 @@ async def register(request: RegisterRequest):
                 logger.error(f"❌ Registration failed for {request.email}")
                 # Try to delete auth user if profile creation failed
                 try:
-                    service_key = os.getenv("SUPABASE_SERVICE_KEY", "")
-                    if service_key:
-                        supabase_admin = create_client(SUPABASE_URL, service_key)
-                        supabase_admin.auth.admin.delete_user(auth_user_id)
+                    if db_supabase:
+                        db_supabase.auth.admin.delete_user(auth_user_id)
                         logger.info(f"Cleaned up auth user: {auth_user_id}")
                 except Exception as cleanup_error:
                     logger.warning(f"Could not cleanup auth user: {cleanup_error}")
@@ -470,9 +620,7 @@ async def create_assignment(
         profile = get_user_profile(user.user_id)
         
         # Handle dev mode (bypassed auth)
-        # Check if it's the dev user UUID (00000000-0000-0000-0000-000000000001)
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        is_dev_user = user.user_id == dev_user_id or user.user_id == "dev-user-id"
+        is_dev_user = user.user_id in DEV_USER_IDS
         if not profile and is_dev_user:
             # Use request section or default
             section = request.section or None  # Optional - not used in class-based system
@@ -483,10 +631,10 @@ async def create_assignment(
             try:
                 # Normalize dev user ID to valid UUID
                 if user.user_id == "dev-user-id":
-                    user.user_id = dev_user_id
+                    user.user_id = DEV_USER_ID
                 
                 # Try to get dev profile by UUID first
-                dev_profile = get_user_profile(dev_user_id)
+                dev_profile = get_user_profile(DEV_USER_ID)
                 
                 # If not found by UUID, try to find by email (in case it exists with different ID)
                 if not dev_profile:
@@ -506,19 +654,19 @@ async def create_assignment(
                             name=user.name,
                             role=user.role,
                             section=section,
-                            user_id=dev_user_id
+                            user_id=DEV_USER_ID
                         )
                         if dev_profile:
                             profile = dev_profile
-                            user.user_id = dev_user_id  # Ensure we use the dev UUID
+                            user.user_id = DEV_USER_ID  # Ensure we use the dev UUID
                             logger.info("✓ Dev user profile created")
                 else:
                     profile = dev_profile
-                    user.user_id = dev_user_id  # Ensure we use the dev UUID
+                    user.user_id = DEV_USER_ID  # Ensure we use the dev UUID
             except Exception as e:
                 logger.warning(f"Could not create/find dev profile: {e}")
-                # Still proceed with dev_user_id for assignment creation
-                user.user_id = dev_user_id
+                # Still proceed with DEV_USER_ID for assignment creation
+                user.user_id = DEV_USER_ID
         elif not profile:
             raise HTTPException(status_code=404, detail="User profile not found")
         else:
@@ -740,10 +888,7 @@ async def unsubmit_assignment(
         if not result.data or len(result.data) == 0:
             # Submission doesn't exist - return success (idempotent operation)
             logger.info(f"No submission found for assignment {assignment_id} - already unsubmitted or never submitted")
-            return {
-                "success": True,
-                "message": "Assignment is not submitted (already unsubmitted or never submitted)"
-            }
+            return ok(message="Assignment is not submitted (already unsubmitted or never submitted)")
         
         submission = result.data[0]
         submission_id = submission["id"]
@@ -782,10 +927,7 @@ async def unsubmit_assignment(
                 }
             )
             
-            return {
-                "success": True,
-                "message": "Assignment unsubmitted successfully"
-            }
+            return ok(message="Assignment unsubmitted successfully")
         else:
             raise HTTPException(status_code=500, detail="Failed to delete submission")
         
@@ -802,7 +944,7 @@ async def unsubmit_assignment(
 @app.get("/get-my-assignments")
 async def get_my_assignments(
     class_id: Optional[str] = None,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(resolve_actual_user)
 ):
     """
     Get assignments visible to the current user.
@@ -817,35 +959,19 @@ async def get_my_assignments(
     try:
         logger.info(f"🔍 Fetching assignments for user: {user.user_id} (role: {user.role})" + (f" (class: {class_id})" if class_id else ""))
         
-        # Handle dev mode: if using dev UUID, try to find actual user by email
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            logger.info(f"Dev mode detected, looking up actual user by email: {user.email}")
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-                logger.info(f"✓ Found actual user ID: {actual_user_id} for dev user {user.email}")
-            else:
-                logger.warning(f"⚠️ Dev user {user.email} not found in database, using dev UUID")
-        
         if user.is_student():
-            assignments = get_student_assignments(actual_user_id, class_id)
+            assignments = get_student_assignments(user.user_id, class_id)
         elif user.is_teacher():
-            assignments = get_teacher_assignments(actual_user_id, class_id)
+            assignments = get_teacher_assignments(user.user_id, class_id)
         elif user.is_admin():
             # Admins see all - would need admin helper function
             assignments = []  # TODO: Implement admin view
         else:
             assignments = []
         
-        logger.info(f"✓ Returning {len(assignments)} assignments for user {actual_user_id}")
+        logger.info(f"✓ Returning {len(assignments)} assignments for user {user.user_id}")
         
-        return {
-            "success": True,
-            "assignments": assignments,
-            "count": len(assignments)
-        }
+        return ok_list("assignments", assignments)
     except Exception as e:
         logger.error(f"Error fetching assignments: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -857,7 +983,7 @@ async def get_my_assignments(
 @app.get("/get-my-submissions")
 async def get_my_submissions(
     assignment_id: Optional[str] = None,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(resolve_actual_user)
 ):
     """
     Get student's own submissions (Student only).
@@ -871,30 +997,16 @@ async def get_my_submissions(
         )
     
     try:
-        # Handle dev mode: if using dev UUID, try to find actual user by email
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            logger.info(f"Dev mode detected in get_my_submissions, looking up actual user by email: {user.email}")
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-                logger.info(f"✓ Found actual user ID: {actual_user_id} for dev user {user.email}")
-        
         # Get student's submissions
-        all_submissions = get_student_submissions(actual_user_id)
+        all_submissions = get_student_submissions(user.user_id)
         
         # Filter by assignment_id if provided
         if assignment_id:
             all_submissions = [s for s in all_submissions if s.get("assignment_id") == assignment_id]
         
-        logger.info(f"✓ Returning {len(all_submissions)} submissions for student {actual_user_id}")
+        logger.info(f"✓ Returning {len(all_submissions)} submissions for student {user.user_id}")
         
-        return {
-            "success": True,
-            "submissions": all_submissions,
-            "count": len(all_submissions)
-        }
+        return ok_list("submissions", all_submissions)
     except Exception as e:
         logger.error(f"Error fetching student submissions: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -903,87 +1015,186 @@ async def get_my_submissions(
 @app.get("/get-submissions")
 async def get_submissions(
     assignment_id: Optional[str] = None,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Get submissions (Teacher only).
     
     Teachers can only see submissions from their students.
     """
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can view submissions"
-        )
-    
     try:
-        # Handle dev mode: if using dev UUID, try to find actual user by email
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            logger.info(f"Dev mode detected in get_submissions, looking up actual user by email: {user.email}")
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-                logger.info(f"✓ Found actual user ID: {actual_user_id} for dev user {user.email}")
-        
         if user.is_teacher():
-            submissions = get_teacher_submissions(actual_user_id, assignment_id)
+            submissions = get_teacher_submissions_full(user.user_id, assignment_id)
         else:
             # Admin - would need admin helper
             submissions = []
         
-        return {
-            "success": True,
-            "submissions": submissions,
-            "count": len(submissions)
-        }
+        return ok_list("submissions", submissions)
     except Exception as e:
         logger.error(f"Error fetching submissions: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _extract_grade_row(submission: Any) -> Optional[Dict[str, Any]]:
+    """
+    Turn one graded submission from the grading graph into a grade update row.
+    
+    Returns None (and logs why) when the submission has no usable grade. Re-applies the
+    plagiarism rule as a safety net: anything above PLAGIARISM_THRESHOLD is graded 0.
+    """
+    # Pydantic models: dump once so nested grade/source models become JSON-ready dicts
+    # (file content isn't persisted, so don't copy it into the dump)
+    if hasattr(submission, 'model_dump'):
+        submission = submission.model_dump(mode='json', exclude={'file_content'})
+    if not isinstance(submission, dict):
+        logger.error(f"   Unknown submission format: {type(submission)}")
+        return None
+    
+    submission_id = submission.get('submission_id') or submission.get('id')
+    total_score_obj = submission.get('total_score')
+    if not isinstance(total_score_obj, dict):
+        # No grade was assigned - usually an LLM rate limit (429) or an error earlier in grading
+        logger.warning(f"   ⚠️ Submission {submission_id} has no grade (check logs above for rate limits or errors)")
+        return None
+    
+    grade = total_score_obj.get('total_score')
+    if grade is None:
+        logger.warning(f"   Grade is None for submission {submission_id}")
+        return None
+    reason = total_score_obj.get('reason') or "No reason provided"
+    
+    plagiarism = submission.get('plagerism_score')
+    if plagiarism is not None and plagiarism > PLAGIARISM_THRESHOLD and grade != 0.0:
+        logger.warning(f"   ⚠️ Plagiarism {plagiarism}% > threshold {PLAGIARISM_THRESHOLD}% but grade is {grade} - forcing to 0")
+        grade = 0.0
+        reason = f"Grade set to 0 due to high plagiarism score ({plagiarism}% similarity, threshold: {PLAGIARISM_THRESHOLD}%). " + reason
+    
+    return {
+        "id": submission_id,
+        "grade": grade,
+        "grade_reason": reason,
+        "plagiarism_score": plagiarism,
+        "web_sources": submission.get('web_sources') or None,
+        "academic_sources": submission.get('academic_sources') or None
+    }
+
+
+async def _grading_job_heartbeat(job_id: str):
+    """Keep a running grading job's updated_at fresh so grade_status doesn't treat it as stale."""
+    while True:
+        await asyncio.sleep(GRADING_JOB_HEARTBEAT_INTERVAL.total_seconds())
+        await asyncio.to_thread(update_grading_job, job_id, status="running", only_if_running=True)
+
+
+async def _run_grading(job_id: str, assignment_id: str, actual_user_id: str, student_ids: FrozenSet[str]):
+    """
+    Background task: run the grading graph for an assignment and persist the results.
+    
+    Flips the grading job to 'done' (or 'failed') once all submissions are processed.
+    A heartbeat refreshes the job's updated_at while grading is in progress.
+    """
+    heartbeat = asyncio.create_task(_grading_job_heartbeat(job_id))
+    try:
+        await _grade_and_persist(job_id, assignment_id, student_ids)
+    finally:
+        heartbeat.cancel()
+
+
+async def _grade_and_persist(job_id: str, assignment_id: str, student_ids: FrozenSet[str]):
+    """Run the grading graph, save the grades and record the job's final status."""
+    try:
+        # Invoke the grading graph
+        grading_input = {
+            "assignment_id": assignment_id,
+            "submission_ids": [],
+            "student_ids": student_ids  # Pass student IDs to filter submissions
+        }
+        
+        logger.info(f"   [job {job_id}] Invoking grading graph with assignment_id: {assignment_id}, student_ids: {len(student_ids)} students")
+        # Graph nodes are synchronous (blocking Supabase/LLM/HTTP calls), so run the
+        # whole graph in a worker thread to keep the event loop free for other requests
+        result = await asyncio.to_thread(assignment_grader_graph.invoke, grading_input)
+        
+        logger.info(f"✓ Grading graph completed for assignment {assignment_id}")
+        logger.info(f"   Result keys: {list(result.keys()) if result else 'None'}")
+        logger.info(f"   Result type: {type(result)}")
+        
+        # Debug: Print the start of the result without serializing all of it
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("   Full result (first 1000 chars): %s", str(result)[:1000])
+        
+        # Update submissions in database with grades
+        graded_count = 0
+        failed_count = 0
+        
+        if result and "submission_ids" in result:
+            submissions_list = result["submission_ids"]
+            logger.info(f"   Found {len(submissions_list)} submissions in result")
+            
+            if len(submissions_list) == 0:
+                logger.warning(f"   ⚠️ No submissions in result - check if submissions were found and graded")
+            
+            # Normalize every graded submission in one pass, then persist them in one round-trip
+            rows = [row for row in map(_extract_grade_row, submissions_list) if row is not None]
+            updated_ids = await asyncio.to_thread(bulk_update_submission_grades, rows) if rows else []
+            
+            graded_count = len(updated_ids)
+            failed_count = len(submissions_list) - graded_count
+        else:
+            logger.warning(f"   No submissions in result or result structure is invalid")
+            if result:
+                logger.warning(f"   Result keys: {list(result.keys())}")
+        
+        logger.info(f"✓ Grading complete: {graded_count} graded, {failed_count} failed")
+        
+        # Conditional on 'running': a job already failed as stale keeps that status
+        await asyncio.to_thread(
+            update_grading_job,
+            job_id,
+            status="done",
+            graded_count=graded_count,
+            failed_count=failed_count,
+            message=f"Graded {graded_count} submission(s) successfully",
+            only_if_running=True
+        )
+    except Exception as e:
+        logger.error(f"Error grading assignment {assignment_id} (job {job_id}): {e}", exc_info=True)
+        await asyncio.to_thread(
+            update_grading_job,
+            job_id,
+            status="failed",
+            error=f"Error grading assignment: {str(e)}",
+            only_if_running=True
+        )
+
+
 @app.post("/grade-assignment")
 async def grade_assignment(
     assignment_id: str,
-    user: UserContext = Depends(get_current_user)
+    background_tasks: BackgroundTasks,
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Grade all submissions for an assignment using AI (Teacher only).
     
-    This endpoint:
+    Grading runs in the background; this endpoint returns a job ID immediately.
+    Poll /grade-status/{job_id} for progress. The background job:
     1. Fetches all submissions for the assignment
     2. Downloads and parses submission files
     3. Grades each submission using AI with the assignment rubric
     4. Checks for plagiarism
     5. Updates submissions with grades
     """
-    logger.info("=" * 80)
+    logger.info(LOG_BANNER)
     logger.info("🎯 GRADE ASSIGNMENT ENDPOINT CALLED")
     logger.info(f"   Assignment ID: {assignment_id}")
     logger.info(f"   User: {user.email} (ID: {user.user_id}, Role: {user.role})")
-    logger.info("=" * 80)
-    
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can grade assignments"
-        )
+    logger.info(LOG_BANNER)
     
     try:
-        # Handle dev mode: if using dev UUID, try to find actual user by email
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            logger.info(f"Dev mode detected in grade_assignment, looking up actual user by email: {user.email}")
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-                logger.info(f"✓ Found actual user ID: {actual_user_id} for dev user {user.email}")
-        
         # Verify teacher owns this assignment
-        teacher_assignments = get_teacher_assignments(actual_user_id)
-        assignment_ids = [a["id"] for a in teacher_assignments]
+        teacher_assignments = get_teacher_assignments(user.user_id)
+        assignment_ids = {a["id"] for a in teacher_assignments}
         
         if assignment_id not in assignment_ids:
             raise HTTPException(
@@ -994,180 +1205,103 @@ async def grade_assignment(
         logger.info(f"🚀 Starting grading process for assignment {assignment_id}")
         
         # First, check if there are any submissions for this assignment
-        submissions_check = get_teacher_submissions(actual_user_id, assignment_id)
-        logger.info(f"   Found {len(submissions_check)} submissions via get_teacher_submissions")
-        if len(submissions_check) == 0:
-            return {
-                "success": True,
-                "message": "No submissions found for this assignment",
-                "graded_count": 0,
-                "failed_count": 0,
-                "assignment_id": assignment_id
-            }
+        submission_count = count_teacher_submissions(user.user_id, assignment_id)
+        logger.info(f"   Found {submission_count} submissions via count_teacher_submissions")
+        if submission_count == 0:
+            return ok(
+                message="No submissions found for this assignment",
+                graded_count=0,
+                failed_count=0,
+                assignment_id=assignment_id
+            )
         
         # Get student IDs for this teacher (to filter submissions)
-        students = get_teacher_students(actual_user_id)
-        student_ids = [s["id"] for s in students]
+        # frozenset gives O(1) membership checks inside the grading graph
+        student_ids = frozenset(s["id"] for s in get_teacher_students_cached(user.user_id))
         logger.info(f"   Teacher has {len(student_ids)} linked students - will only grade their submissions")
         
-        # Invoke the grading graph
-        grading_input = {
-            "assignment_id": assignment_id,
-            "submission_ids": [],
-            "student_ids": student_ids  # Pass student IDs to filter submissions
-        }
-        
-        logger.info(f"   Invoking grading graph with assignment_id: {assignment_id}, student_ids: {len(student_ids)} students")
-        result = assignment_grader_graph.invoke(grading_input)
+        job_id = create_grading_job(assignment_id, user.user_id)
+        if not job_id:
+            raise HTTPException(status_code=500, detail="Failed to create grading job")
         
-        logger.info(f"✓ Grading graph completed for assignment {assignment_id}")
-        logger.info(f"   Result keys: {list(result.keys()) if result else 'None'}")
-        logger.info(f"   Result type: {type(result)}")
+        background_tasks.add_task(_run_grading, job_id, assignment_id, user.user_id, student_ids)
+        logger.info(f"   Grading job {job_id} dispatched for assignment {assignment_id}")
         
-        # Debug: Print full result structure
-        import json
-        try:
-            result_str = json.dumps(result, default=str, indent=2)
-            logger.info(f"   Full result (first 1000 chars): {result_str[:1000]}")
-        except:
-            logger.info(f"   Could not serialize result for logging")
+        return ok(job_id=job_id, status="running", assignment_id=assignment_id)
         
-        # Update submissions in database with grades
-        graded_count = 0
-        failed_count = 0
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error grading assignment: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error grading assignment: {str(e)}")
+
+
+def _is_stale_grading_job(job: Dict[str, Any]) -> bool:
+    """True when a job's last update is older than GRADING_JOB_STALE_AFTER."""
+    last_update = job.get("updated_at") or job.get("created_at")
+    if not last_update:
+        return False
+    try:
+        updated_at = datetime.fromisoformat(str(last_update).replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - updated_at > GRADING_JOB_STALE_AFTER
+
+
+@app.get("/grade-status/{job_id}")
+async def grade_status(
+    job_id: str,
+    user: UserContext = Depends(teacher_or_admin)
+):
+    """
+    Get the status of a background grading job (Teacher only).
+    
+    Status is one of 'running', 'done' or 'failed'.
+    """
+    try:
+        job = await asyncio.to_thread(get_grading_job, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Grading job not found")
         
-        if result and "submission_ids" in result:
-            submissions_list = result["submission_ids"]
-            logger.info(f"   Found {len(submissions_list)} submissions in result")
-            
-            if len(submissions_list) == 0:
-                logger.warning(f"   ⚠️ No submissions in result - check if submissions were found and graded")
-            
-            for i, submission in enumerate(submissions_list):
-                logger.info(f"   Processing submission {i+1}/{len(submissions_list)}")
-                logger.info(f"   Submission type: {type(submission)}")
-                logger.info(f"   Submission repr: {repr(submission)[:200]}")
-                
-                # Handle both Pydantic model and dict formats
-                if hasattr(submission, 'submission_id'):
-                    submission_id = submission.submission_id
-                    total_score_obj = submission.total_score
-                    plagiarism = submission.plagerism_score
-                    web_sources = submission.web_sources if hasattr(submission, 'web_sources') else None
-                    academic_sources = submission.academic_sources if hasattr(submission, 'academic_sources') else None
-                elif isinstance(submission, dict):
-                    submission_id = submission.get('submission_id') or submission.get('id')
-                    total_score_obj = submission.get('total_score')
-                    plagiarism = submission.get('plagerism_score')
-                    web_sources = submission.get('web_sources')
-                    academic_sources = submission.get('academic_sources')
-                else:
-                    logger.error(f"   Unknown submission format: {type(submission)}")
-                    failed_count += 1
-                    continue
-                
-                # Convert Pydantic models to dicts for database storage
-                if web_sources and isinstance(web_sources, list):
-                    web_sources = [s.dict() if hasattr(s, 'dict') else s for s in web_sources]
-                if academic_sources and isinstance(academic_sources, list):
-                    academic_sources = [s.dict() if hasattr(s, 'dict') else s for s in academic_sources]
-                
-                logger.info(f"   Submission ID: {submission_id}")
-                logger.info(f"   Plagiarism score: {plagiarism}")
-                logger.info(f"   Total score object type: {type(total_score_obj)}")
-                logger.info(f"   Total score object: {total_score_obj}")
-                
-                if total_score_obj:
-                    # Handle both Pydantic model and dict formats for total_score
-                    if hasattr(total_score_obj, 'total_score'):
-                        grade = total_score_obj.total_score
-                        reason = total_score_obj.reason
-                    elif isinstance(total_score_obj, dict):
-                        grade = total_score_obj.get('total_score')
-                        reason = total_score_obj.get('reason')
-                    else:
-                        logger.warning(f"   Unknown total_score format: {type(total_score_obj)}, value: {total_score_obj}")
-                        failed_count += 1
-                        continue
-                    
-                    # Validate grade and reason
-                    if grade is None:
-                        logger.warning(f"   Grade is None for submission {submission_id}")
-                        failed_count += 1
-                        continue
-                    if not reason:
-                        logger.warning(f"   Reason is empty for submission {submission_id}")
-                        reason = "No reason provided"
-                    
-                    # CRITICAL: Check if grade should be 0 due to plagiarism (double-check)
-                    PLAGIARISM_THRESHOLD = 40.0
-                    logger.info(f"   Checking plagiarism: {plagiarism}% vs threshold {PLAGIARISM_THRESHOLD}%")
-                    logger.info(f"   Current grade before plagiarism check: {grade}")
-                    
-                    if plagiarism is not None and plagiarism > PLAGIARISM_THRESHOLD:
-                        logger.warning(f"   ⚠️ Plagiarism {plagiarism}% > threshold {PLAGIARISM_THRESHOLD}% - grade should be 0, but got {grade}")
-                        if grade != 0.0:
-                            logger.error(f"   ❌ ERROR: Grade is {grade} but should be 0 due to plagiarism! FORCING TO 0...")
-                            # Force grade to 0
-                            grade = 0.0
-                            reason = f"Grade set to 0 due to high plagiarism score ({plagiarism}% similarity, threshold: {PLAGIARISM_THRESHOLD}%). " + reason
-                            logger.info(f"   ✓ Grade forced to 0")
-                        else:
-                            logger.info(f"   ✓ Grade is already 0 (correct)")
-                    else:
-                        logger.info(f"   ✓ Plagiarism {plagiarism}% is acceptable (<= {PLAGIARISM_THRESHOLD}%)")
-                    
-                    logger.info(f"   Final Grade to save: {grade}, Reason length: {len(reason) if reason else 0}")
-                    
-                    success = update_submission_grade(
-                        submission_id=submission_id,
-                        grade=grade,
-                        grade_reason=reason,
-                        plagiarism_score=plagiarism,
-                        web_sources=web_sources,
-                        academic_sources=academic_sources
-                    )
-                    
-                    if success:
-                        graded_count += 1
-                        logger.info(f"   ✓ Successfully updated grade for submission {submission_id}")
-                    else:
-                        failed_count += 1
-                        logger.warning(f"   ✗ Failed to update grade for submission {submission_id}")
-                else:
-                    # No grade was assigned - this usually means an error occurred during grading
-                    logger.warning(f"   ⚠️ Submission {submission_id} has no grade (total_score_obj is None)")
-                    logger.warning(f"   This usually means:")
-                    logger.warning(f"   1. The LLM API hit a rate limit (check logs for 429 errors)")
-                    logger.warning(f"   2. An error occurred during grading (check logs above)")
-                    logger.warning(f"   3. The grading process was interrupted")
-                    failed_count += 1
-                    continue
-        else:
-            logger.warning(f"   No submissions in result or result structure is invalid")
-            if result:
-                logger.warning(f"   Result keys: {list(result.keys())}")
+        # Verify the job belongs to this teacher (unless admin)
+        if not user.is_admin():
+            if str(job.get("teacher_id")) != str(user.user_id):
+                raise HTTPException(
+                    status_code=403,
+                    detail="You can only view grading jobs you started"
+                )
         
-        logger.info(f"✓ Grading complete: {graded_count} graded, {failed_count} failed")
+        # A job lost to a worker restart/crash stays 'running' forever - fail it once it's stale
+        if job.get("status") == "running" and _is_stale_grading_job(job):
+            error = "Grading job stopped responding (the server may have restarted). Please try again."
+            logger.warning("Grading job %s is stale, marking it failed", job_id)
+            if await asyncio.to_thread(update_grading_job, job_id, status="failed", error=error, only_if_running=True):
+                job = {**job, "status": "failed", "message": None, "error": error}
+            else:
+                # The job finished between the read and the write - report its final status
+                job = await asyncio.to_thread(get_grading_job, job_id) or job
         
         return {
-            "success": True,
-            "message": f"Graded {graded_count} submission(s) successfully",
-            "graded_count": graded_count,
-            "failed_count": failed_count,
-            "assignment_id": assignment_id
+            "success": job.get("status") != "failed",
+            "job_id": job_id,
+            "status": job.get("status"),
+            "message": job.get("message") or job.get("error"),
+            "graded_count": job.get("graded_count", 0),
+            "failed_count": job.get("failed_count", 0),
+            "assignment_id": job.get("assignment_id")
         }
-        
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error grading assignment: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error grading assignment: {str(e)}")
+        logger.error(f"Error fetching grading status: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/export-grades-csv")
 async def export_grades_csv(
     assignment_id: str,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Export grades for an assignment as CSV (Teacher only).
@@ -1178,151 +1312,79 @@ async def export_grades_csv(
     - Grade, plagiarism score, grade reason
     - Submission date
     """
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can export grades"
-        )
-    
     try:
         logger.info(f"📊 Exporting grades CSV for assignment {assignment_id} by {user.email}")
         
-        # Initialize actual_user_id (used for both ownership check and fetching submissions)
-        actual_user_id = user.user_id
-        
-        # Verify assignment belongs to teacher (unless admin)
+        # Teachers export submissions from students enrolled in their classes; the
+        # assignments!inner join also limits rows to assignments the teacher owns
+        submissions = []
         if not user.is_admin():
-            # Handle dev mode: if using dev UUID, try to find actual user by email
-            dev_user_id = "00000000-0000-0000-0000-000000000001"
-            is_dev_mode = user.user_id == dev_user_id or user.user_id == "dev-user-id"
+            submissions = await asyncio.to_thread(get_teacher_submissions_full, user.user_id, assignment_id)
+        
+        if not submissions:
+            # Empty result is ambiguous - only now look up the assignment to pick 404 vs 403
+            if not db_supabase:
+                raise HTTPException(status_code=500, detail="Database not configured")
             
-            if is_dev_mode:
-                logger.info(f"Dev mode detected in export_grades_csv, looking up actual user by email: {user.email}")
-                existing_user = get_user_by_email(user.email)
-                if existing_user:
-                    actual_user_id = existing_user['id']
-                    logger.info(f"✓ Found actual user ID: {actual_user_id} for dev user {user.email}")
+            result = await asyncio.to_thread(
+                db_supabase.table("assignments").select("teacher_id").eq("id", assignment_id).execute
+            )
+            if not result.data:
+                logger.warning(f"   Assignment {assignment_id} not found in database")
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Assignment {assignment_id} not found"
+                )
             
-            # Directly verify assignment ownership by querying the assignment
-            try:
-                if db_supabase:
-                    result = db_supabase.table("assignments").select("teacher_id").eq("id", assignment_id).execute()
-                    if not result.data:
-                        logger.warning(f"   Assignment {assignment_id} not found in database")
-                        raise HTTPException(
-                            status_code=404,
-                            detail=f"Assignment {assignment_id} not found"
-                        )
-                    
-                    assignment_teacher_id = result.data[0].get("teacher_id")
-                    logger.info(f"   Assignment {assignment_id} belongs to teacher: {assignment_teacher_id}")
-                    logger.info(f"   Current user ID: {actual_user_id}")
-                    
-                    # In dev mode, if the user lookup failed (wrong email), try to use the assignment's teacher_id
-                    if is_dev_mode and str(assignment_teacher_id) != str(actual_user_id):
-                        logger.info(f"   Dev mode: assignment teacher ID doesn't match, checking if we can use assignment's teacher_id")
-                        # Check if the assignment's teacher can access submissions (class-based access check)
-                        # This handles the case where token decoding failed but the user should have access
-                        try:
-                            test_submissions = get_teacher_submissions(assignment_teacher_id, assignment_id)
-                            if test_submissions:
-                                logger.info(f"   Dev mode: Assignment teacher {assignment_teacher_id} can access submissions, allowing export")
-                                actual_user_id = assignment_teacher_id
-                            else:
-                                logger.warning(f"   Dev mode: Assignment teacher {assignment_teacher_id} cannot access submissions")
-                        except Exception as e:
-                            logger.warning(f"   Dev mode: Error checking submissions access: {e}")
-                    
-                    if str(assignment_teacher_id) != str(actual_user_id):
-                        logger.warning(f"   Assignment ownership mismatch: assignment belongs to {assignment_teacher_id}, but user is {actual_user_id}")
-                        raise HTTPException(
-                            status_code=403,
-                            detail="You can only export grades for your own assignments"
-                        )
-                    logger.info(f"   ✓ Assignment ownership verified")
-                else:
-                    # Fallback to list-based check if supabase not available
-                    assignments = get_teacher_assignments(actual_user_id)
-                    assignment_ids = [a.get("id") for a in assignments]
-                    if assignment_id not in assignment_ids:
-                        logger.warning(f"   Assignment {assignment_id} not found in teacher's assignments")
-                        raise HTTPException(
-                            status_code=403,
-                            detail="You can only export grades for your own assignments"
-                        )
-            except HTTPException:
-                raise
-            except Exception as e:
-                logger.error(f"   Error verifying assignment ownership: {e}", exc_info=True)
+            assignment_teacher_id = result.data[0].get("teacher_id")
+            # Admins, and dev users that could not be resolved to a real profile, export
+            # what the assignment's teacher would see (that teacher's enrolled students)
+            if user.is_admin() or user.user_id in DEV_USER_IDS:
+                submissions = await asyncio.to_thread(get_teacher_submissions_full, assignment_teacher_id, assignment_id)
+            elif str(assignment_teacher_id) != str(user.user_id):
+                logger.warning(f"   Assignment ownership mismatch: assignment belongs to {assignment_teacher_id}, but user is {user.user_id}")
                 raise HTTPException(
-                    status_code=500,
-                    detail="Error verifying assignment ownership"
+                    status_code=403,
+                    detail="You can only export grades for your own assignments"
                 )
         
-        # Get all submissions for this assignment
-        # Use the same actual_user_id we determined during ownership check
-        # (it's already set above, but we ensure it's used consistently)
-        submissions = get_teacher_submissions(actual_user_id, assignment_id)
-        
         if not submissions:
             raise HTTPException(
                 status_code=404,
                 detail="No submissions found for this assignment"
             )
         
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            "Student Name",
-            "Roll Number",
-            "Assignment Title",
-            "Grade",
-            "Plagiarism Score (%)",
-            "Grade Reason",
-            "Submission Date",
-            "File URL"
-        ])
-        
-        # Write data rows
+        # Build the grades table column-wise and let pandas' C csv writer format it
+        rows = []
         for submission in submissions:
-            profile = submission.get("profiles", {})
-            assignment = submission.get("assignments", {})
-            
-            student_name = profile.get("name", "N/A") if profile else "N/A"
-            roll_number = submission.get("roll_number") or profile.get("roll_number", "N/A") if profile else "N/A"
-            assignment_title = assignment.get("topic", assignment.get("title", "N/A")) if assignment else "N/A"
-            grade = submission.get("grade", "Not Graded")
-            plagiarism_score = submission.get("plagiarism_score", "N/A")
-            grade_reason = submission.get("grade_reason", "N/A") or "N/A"
-            submission_date = submission.get("submitted_at", "N/A")
-            file_url = submission.get("file_url", "N/A") or "N/A"
-            
-            # Format date if available
-            if submission_date and submission_date != "N/A":
-                try:
-                    if isinstance(submission_date, str):
-                        # Parse ISO format date
-                        dt = datetime.fromisoformat(submission_date.replace('Z', '+00:00'))
-                        submission_date = dt.strftime("%Y-%m-%d %H:%M:%S")
-                except:
-                    pass  # Keep original if parsing fails
-            
-            writer.writerow([
-                student_name,
-                roll_number,
-                assignment_title,
-                grade,
-                plagiarism_score,
-                grade_reason[:200] if grade_reason and len(grade_reason) > 200 else grade_reason,  # Truncate long reasons
-                submission_date,
-                file_url
-            ])
-        
-        # Get CSV content
-        csv_content = output.getvalue()
+            profile = submission.get("profiles") or {}
+            assignment = submission.get("assignments") or {}
+            rows.append({
+                "Student Name": profile.get("name", "N/A") if profile else "N/A",
+                "Roll Number": submission.get("roll_number") or profile.get("roll_number", "N/A") if profile else "N/A",
+                "Assignment Title": assignment.get("topic", assignment.get("title", "N/A")) if assignment else "N/A",
+                "Grade": submission.get("grade", "Not Graded"),
+                "Plagiarism Score (%)": submission.get("plagiarism_score", "N/A"),
+                "Grade Reason": submission.get("grade_reason", "N/A") or "N/A",
+                "Submission Date": submission.get("submitted_at", "N/A"),
+                "File URL": submission.get("file_url", "N/A") or "N/A"
+            })
+        
+        import pandas as pd  # deferred: only the CSV export needs it, keeps worker startup light
+        
+        df = pd.DataFrame(rows, columns=list(CSV_HEADER))
+        
+        # Truncate long reasons
+        df["Grade Reason"] = df["Grade Reason"].str.slice(0, 200)
+        
+        # Format ISO dates in one vectorized pass; keep the original value if parsing fails
+        submission_dates = pd.to_datetime(df["Submission Date"], utc=True, errors="coerce", format="ISO8601")
+        df["Submission Date"] = submission_dates.dt.strftime("%Y-%m-%d %H:%M:%S").fillna(df["Submission Date"])
+        
+        # Encode straight into a bytes buffer so Response doesn't re-encode a str copy
+        output = io.BytesIO()
+        df.to_csv(output, index=False, chunksize=1000, encoding="utf-8")
+        csv_bytes = output.getvalue()
         output.close()
         
         # Generate filename with assignment title and date
@@ -1334,16 +1396,15 @@ async def export_grades_csv(
             if assignment_data:
                 assignment_title = assignment_data.get("title", "assignment")
         
-        assignment_title_safe = assignment_title[:50] if assignment_title else "assignment"
-        assignment_title_safe = "".join(c for c in assignment_title_safe if c.isalnum() or c in (' ', '-', '_')).strip()
+        assignment_title_safe = _TITLE_RE.sub("", (assignment_title or "assignment")[:50]).strip()
         filename = f"grades_{assignment_title_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         
         logger.info(f"✓ Generated CSV with {len(submissions)} submissions")
         
         # Return CSV as downloadable file
         return Response(
-            content=csv_content,
-            media_type="text/csv",
+            content=csv_bytes,
+            media_type="text/csv; charset=utf-8",
             headers={
                 "Content-Disposition": f"attachment; filename={filename}"
             }
@@ -1363,34 +1424,20 @@ async def export_grades_csv(
 async def update_assignment(
     assignment_id: str,
     request: AssignmentRequest,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Update an assignment (Teacher only).
     
     Teachers can only update their own assignments.
     """
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can update assignments"
-        )
-    
     try:
-        # Handle dev mode: resolve actual user ID
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-        
         logger.info(f"Teacher {user.email} updating assignment {assignment_id}")
         
         # Update assignment in database
         success = update_assignment_in_db(
             assignment_id=assignment_id,
-            teacher_id=actual_user_id,
+            teacher_id=user.user_id,
             topic=request.topic,
             description=request.description,
             assignment_type=request.type,
@@ -1400,10 +1447,8 @@ async def update_assignment(
         )
         
         if success:
-            return {
-                "success": True,
-                "message": "Assignment updated successfully"
-            }
+            invalidate_admin_cache()
+            return ok(message="Assignment updated successfully")
         else:
             raise HTTPException(
                 status_code=400,
@@ -1419,41 +1464,25 @@ async def update_assignment(
 @app.delete("/delete-assignment")
 async def delete_assignment(
     assignment_id: str,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Delete an assignment (Teacher only).
     
     Teachers can only delete their own assignments.
     """
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can delete assignments"
-        )
-    
     try:
-        # Handle dev mode: resolve actual user ID
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-        
         logger.info(f"Teacher {user.email} deleting assignment {assignment_id}")
         
         # Delete assignment from database
         success = delete_assignment_in_db(
             assignment_id=assignment_id,
-            teacher_id=actual_user_id
+            teacher_id=user.user_id
         )
         
         if success:
-            return {
-                "success": True,
-                "message": "Assignment deleted successfully"
-            }
+            invalidate_admin_cache()
+            return ok(message="Assignment deleted successfully")
         else:
             raise HTTPException(
                 status_code=400,
@@ -1473,39 +1502,27 @@ async def delete_assignment(
 @app.post("/create-class")
 async def create_class_endpoint(
     request: ClassRequest,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Create a new class (Teacher/Admin only).
     """
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can create classes"
-        )
-    
     try:
-        # Handle dev mode
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
+        logger.info("User %s creating class: %s", user.email, request.name)
         
-        logger.info(f"User {user.email} creating class: {request.name}")
+        # Reject malformed codes before hitting the database
+        if request.code is not None and not _CLASS_CODE_RE.fullmatch(request.code):
+            raise HTTPException(status_code=400, detail="Invalid class code. Use up to 50 letters, digits, spaces, '.', '-' or '_'")
         
-        class_id = create_class(request.name, request.code, request.description)
+        class_id = await asyncio.to_thread(create_class, request.name, request.code, request.description)
         
         if class_id:
             # Automatically assign the teacher to the class
-            assign_teacher_to_class(actual_user_id, class_id)
+            await asyncio.to_thread(assign_teacher_to_class, user.user_id, class_id)
+            invalidate_teacher_classes_cache(user.user_id)
+            invalidate_admin_cache()
             
-            return {
-                "success": True,
-                "class_id": class_id,
-                "message": "Class created successfully"
-            }
+            return ok(class_id=class_id, message="Class created successfully")
         else:
             raise HTTPException(
                 status_code=400,
@@ -1514,46 +1531,46 @@ async def create_class_endpoint(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error creating class: {e}", exc_info=True)
+        logger.error("Error creating class: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/get-my-classes")
 async def get_my_classes(
-    user: UserContext = Depends(get_current_user)
+    limit: int = Query(50, ge=1, le=200, description="Page size (admins only)"),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from the previous page (admins only)"),
+    user: UserContext = Depends(resolve_actual_user)
 ):
     """
     Get classes for the current user.
     
     - Students: Get classes they're enrolled in
     - Teachers: Get classes they teach
-    - Admins: Get all classes (TODO)
+    - Admins: Get all classes, newest first, paginated with limit/cursor
     """
     try:
-        # Handle dev mode
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-        
         if user.is_student():
-            classes = get_student_classes(actual_user_id)
+            classes = await asyncio.to_thread(get_student_classes, user.user_id)
         elif user.is_teacher():
-            classes = get_teacher_classes(actual_user_id)
+            classes = await asyncio.to_thread(get_teacher_classes, user.user_id)
         elif user.is_admin():
-            classes = []  # TODO: Implement admin view
+            if cursor:
+                try:
+                    decode_classes_cursor(cursor)
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Invalid cursor")
+            page = await asyncio.to_thread(get_classes_page, limit, cursor)
+            response = ok_list("classes", page["classes"])
+            response["next_cursor"] = page["next_cursor"]
+            return response
         else:
             classes = []
         
-        return {
-            "success": True,
-            "classes": classes,
-            "count": len(classes)
-        }
+        return ok_list("classes", classes)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error fetching classes: {e}", exc_info=True)
+        logger.error("Error fetching classes: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1561,45 +1578,28 @@ async def get_my_classes(
 async def enroll_student_endpoint(
     student_id: str,
     class_id: str,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Enroll a student in a class (Teacher/Admin only).
     
     Teachers can only enroll students in classes they teach.
     """
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can enroll students"
-        )
-    
     try:
-        # Handle dev mode
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-        
         # Verify teacher teaches this class (unless admin)
         if not user.is_admin():
-            teacher_classes = get_teacher_classes(actual_user_id)
-            class_ids = [c["id"] for c in teacher_classes]
-            if class_id not in class_ids:
+            if class_id not in await load_teacher_class_ids(user):
                 raise HTTPException(
                     status_code=403,
                     detail="You can only enroll students in classes you teach"
                 )
         
-        success = enroll_student_in_class(student_id, class_id)
+        success = await asyncio.to_thread(enroll_student_in_class, student_id, class_id)
         
         if success:
-            return {
-                "success": True,
-                "message": "Student enrolled successfully"
-            }
+            invalidate_teacher_students_cache()
+            invalidate_admin_cache()
+            return ok(message="Student enrolled successfully")
         else:
             raise HTTPException(
                 status_code=400,
@@ -1608,63 +1608,43 @@ async def enroll_student_endpoint(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error enrolling student: {e}", exc_info=True)
+        logger.error("Error enrolling student: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/get-class-students")
+@app.get("/get-class-students", response_class=ORJSONResponse)
 async def get_class_students_endpoint(
     class_id: str,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Get all students enrolled in a class (Teacher/Admin only).
     
     Teachers can only view students in classes they teach.
     """
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can view class students"
-        )
-    
     try:
-        # Handle dev mode
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-        
         # Verify teacher teaches this class (unless admin)
         if not user.is_admin():
-            teacher_classes = get_teacher_classes(actual_user_id)
-            class_ids = [c["id"] for c in teacher_classes]
-            if class_id not in class_ids:
+            if class_id not in await load_teacher_class_ids(user):
                 raise HTTPException(
                     status_code=403,
                     detail="You can only view students in classes you teach"
                 )
         
-        students = get_class_students(class_id)
+        students = await asyncio.to_thread(get_class_students, class_id)
         
-        return {
-            "success": True,
-            "students": students,
-            "count": len(students)
-        }
+        return ORJSONResponse(ok_list("students", students))
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching class students: {e}", exc_info=True)
+        logger.error("Error fetching class students: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/enroll-by-code")
 async def enroll_by_code_endpoint(
     class_code: str,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(resolve_actual_user)
 ):
     """
     Enroll a student in a class using the class code (Student only).
@@ -1678,56 +1658,39 @@ async def enroll_by_code_endpoint(
         )
     
     try:
-        # Handle dev mode
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-        
-        logger.info(f"Student {user.email} attempting to enroll in class with code: {class_code}")
-        
-        # Find class by code
-        class_data = get_class_by_code(class_code)
-        if not class_data:
+        logger.info("Student %s attempting to enroll in class with code: %s", user.email, class_code)
+        
+        # Find the class, check enrollment and enroll in a single round-trip
+        enrollment = await asyncio.to_thread(enroll_student_by_code, user.user_id, class_code)
+        if not enrollment:
             raise HTTPException(
                 status_code=404,
                 detail=f"Class with code '{class_code}' not found"
             )
         
-        class_id = class_data["id"]
-        
-        # Check if already enrolled
-        if is_student_enrolled(actual_user_id, class_id):
+        class_name = enrollment.get("class_name")
+        if not enrollment.get("inserted"):
             raise HTTPException(
                 status_code=400,
-                detail=f"You are already enrolled in {class_data.get('name', 'this class')}"
+                detail=f"You are already enrolled in {class_name or 'this class'}"
             )
         
-        # Enroll the student
-        success = enroll_student_in_class(actual_user_id, class_id)
-        
-        if success:
-            logger.info(f"✓ Student {user.email} enrolled in class {class_data.get('name')} ({class_code})")
-            return {
-                "success": True,
-                "message": f"Successfully enrolled in {class_data.get('name', 'class')}",
-                "class": {
-                    "id": class_id,
-                    "name": class_data.get("name"),
-                    "code": class_data.get("code")
-                }
+        invalidate_teacher_students_cache()
+        invalidate_admin_cache()
+        logger.info("✓ Student %s enrolled in class %s (%s)", user.email, class_name, class_code)
+        return {
+            "success": True,
+            "message": f"Successfully enrolled in {class_name or 'class'}",
+            "class": {
+                "id": enrollment["class_id"],
+                "name": class_name,
+                "code": enrollment.get("class_code")
             }
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="Failed to enroll in class"
-            )
+        }
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error enrolling student by code: {e}", exc_info=True)
+        logger.error("Error enrolling student by code: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1737,78 +1700,54 @@ async def enroll_by_code_endpoint(
 
 @app.get("/admin/stats")
 async def admin_stats(
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(admin_only)
 ):
     """Get system statistics (Admin only)."""
-    if not user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
-        stats = get_system_stats()
-        return {
-            "success": True,
-            "stats": stats
-        }
+        stats = await asyncio.to_thread(get_system_stats_cached)
+        return ok(stats=stats)
     except Exception as e:
-        logger.error(f"Error fetching admin stats: {e}", exc_info=True)
+        logger.error("Error fetching admin stats: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/admin/users")
+@app.get("/admin/users", response_class=ORJSONResponse)
 async def admin_get_users(
     role: Optional[str] = None,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(admin_only)
 ):
     """Get all users (Admin only). Optionally filter by role."""
-    if not user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
-        users = get_all_users(role=role)
-        return {
-            "success": True,
-            "users": users
-        }
+        users = await asyncio.to_thread(get_all_users, role=role)
+        return ORJSONResponse(ok_list("users", users))
     except Exception as e:
-        logger.error(f"Error fetching users: {e}", exc_info=True)
+        logger.error("Error fetching users: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/admin/classes")
+@app.get("/admin/classes", response_class=ORJSONResponse)
 async def admin_get_classes(
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(admin_only)
 ):
     """Get all classes (Admin only)."""
-    if not user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
-        classes = get_all_classes()
-        return {
-            "success": True,
-            "classes": classes
-        }
+        classes = await asyncio.to_thread(get_all_classes_cached)
+        return ORJSONResponse(ok_list("classes", classes))
     except Exception as e:
-        logger.error(f"Error fetching classes: {e}", exc_info=True)
+        logger.error("Error fetching classes: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/admin/assignments")
+@app.get("/admin/assignments", response_class=ORJSONResponse)
 async def admin_get_assignments(
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(admin_only)
 ):
     """Get all assignments (Admin only)."""
-    if not user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
-        assignments = get_all_assignments()
-        return {
-            "success": True,
-            "assignments": assignments
-        }
+        assignments = await asyncio.to_thread(get_all_assignments_cached)
+        return ORJSONResponse(ok_list("assignments", assignments))
     except Exception as e:
-        logger.error(f"Error fetching assignments: {e}", exc_info=True)
+        logger.error("Error fetching assignments: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1816,28 +1755,51 @@ async def admin_get_assignments(
 async def admin_update_user_role(
     user_id: str,
     new_role: str = Query(..., description="New role: 'admin', 'teacher', or 'student'"),
-    admin_user: UserContext = Depends(get_current_user)
+    admin_user: UserContext = Depends(admin_only)
 ):
     """Update user role (Admin only)."""
-    if not admin_user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     if new_role not in ["admin", "teacher", "student"]:
         raise HTTPException(status_code=400, detail="Invalid role. Must be 'admin', 'teacher', or 'student'")
     
     try:
-        success = update_user_role(user_id, new_role)
+        success = await asyncio.to_thread(update_user_role, user_id, new_role)
         if success:
-            return {
-                "success": True,
-                "message": f"User role updated to {new_role}"
-            }
+            invalidate_user_caches([user_id])
+            return ok(message=f"User role updated to {new_role}")
         else:
             raise HTTPException(status_code=404, detail="User not found or update failed")
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error updating user role: {e}", exc_info=True)
+        logger.error("Error updating user role: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.put("/admin/users/roles")
+async def admin_bulk_update_user_roles(
+    request: BulkRoleUpdateRequest,
+    admin_user: UserContext = Depends(admin_only)
+):
+    """Update roles for several users at once (Admin only).
+    
+    Updates are grouped by role, so this issues at most one UPDATE per role.
+    """
+    ids_by_role: Dict[str, List[str]] = {}
+    for update in request.updates:
+        if update.new_role not in ["admin", "teacher", "student"]:
+            raise HTTPException(status_code=400, detail="Invalid role. Must be 'admin', 'teacher', or 'student'")
+        ids_by_role.setdefault(update.new_role, []).append(update.user_id)
+    
+    try:
+        updated_ids: List[str] = []
+        for role, user_ids in ids_by_role.items():
+            updated_ids.extend(await asyncio.to_thread(update_users_role, user_ids, role))
+        updated_count = len(updated_ids)
+        if updated_ids:
+            invalidate_user_caches(updated_ids)
+        return ok(updated_count=updated_count, message=f"Updated {updated_count} user role(s)")
+    except Exception as e:
+        logger.error("Error bulk updating user roles: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1845,25 +1807,22 @@ async def admin_update_user_role(
 async def admin_assign_teacher(
     class_id: str,
     teacher_id: str,
-    admin_user: UserContext = Depends(get_current_user)
+    admin_user: UserContext = Depends(admin_only)
 ):
     """Assign a teacher to a class (Admin only)."""
-    if not admin_user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
-        success = assign_teacher_to_class_admin(class_id, teacher_id)
+        success = await asyncio.to_thread(assign_teacher_to_class_admin, class_id, teacher_id)
         if success:
-            return {
-                "success": True,
-                "message": "Teacher assigned to class"
-            }
+            invalidate_teacher_students_cache(teacher_id)
+            invalidate_teacher_classes_cache(teacher_id)
+            invalidate_admin_cache()
+            return ok(message="Teacher assigned to class")
         else:
             raise HTTPException(status_code=400, detail="Failed to assign teacher to class")
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error assigning teacher: {e}", exc_info=True)
+        logger.error("Error assigning teacher: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1871,25 +1830,21 @@ async def admin_assign_teacher(
 async def admin_enroll_student(
     class_id: str,
     student_id: str,
-    admin_user: UserContext = Depends(get_current_user)
+    admin_user: UserContext = Depends(admin_only)
 ):
     """Enroll a student in a class (Admin only)."""
-    if not admin_user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
-        success = enroll_student_in_class_admin(class_id, student_id)
+        success = await asyncio.to_thread(enroll_student_in_class_admin, class_id, student_id)
         if success:
-            return {
-                "success": True,
-                "message": "Student enrolled in class"
-            }
+            invalidate_teacher_students_cache()
+            invalidate_admin_cache()
+            return ok(message="Student enrolled in class")
         else:
             raise HTTPException(status_code=400, detail="Failed to enroll student in class")
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error enrolling student: {e}", exc_info=True)
+        logger.error("Error enrolling student: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1898,57 +1853,72 @@ async def admin_remove_user_from_class(
     class_id: str,
     user_id: str,
     user_role: str = Query(..., description="Role of user to remove: 'teacher' or 'student'"),
-    admin_user: UserContext = Depends(get_current_user)
+    admin_user: UserContext = Depends(admin_only)
 ):
     """Remove a user (teacher or student) from a class (Admin only)."""
-    if not admin_user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     if user_role not in ["teacher", "student"]:
         raise HTTPException(status_code=400, detail="Invalid user_role. Must be 'teacher' or 'student'")
     
     try:
-        success = remove_user_from_class(user_id, class_id, user_role)
+        success = await asyncio.to_thread(remove_user_from_class, user_id, class_id, user_role)
         if success:
-            return {
-                "success": True,
-                "message": f"{user_role.capitalize()} removed from class"
-            }
+            if user_role == "teacher":
+                invalidate_teacher_students_cache(user_id)
+                invalidate_teacher_classes_cache(user_id)
+            else:
+                invalidate_teacher_students_cache()
+            invalidate_admin_cache()
+            return ok(message=f"{user_role.capitalize()} removed from class")
         else:
             raise HTTPException(status_code=400, detail="Failed to remove user from class")
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error removing user from class: {e}", exc_info=True)
+        logger.error("Error removing user from class: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.delete("/admin/users/{user_id}")
 async def admin_delete_user(
     user_id: str,
-    admin_user: UserContext = Depends(get_current_user)
+    admin_user: UserContext = Depends(admin_only)
 ):
     """Delete a user (Admin only)."""
-    if not admin_user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     # Prevent self-deletion
     if user_id == admin_user.user_id:
         raise HTTPException(status_code=400, detail="Cannot delete your own account")
     
     try:
-        success = delete_user_profile(user_id)
+        success = await asyncio.to_thread(delete_user_profile, user_id)
         if success:
-            return {
-                "success": True,
-                "message": "User deleted successfully"
-            }
+            invalidate_user_caches([user_id])
+            return ok(message="User deleted successfully")
         else:
             raise HTTPException(status_code=404, detail="User not found or deletion failed")
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting user: {e}", exc_info=True)
+        logger.error("Error deleting user: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/admin/users/bulk-delete")
+async def admin_bulk_delete_users(
+    request: BulkDeleteUsersRequest,
+    admin_user: UserContext = Depends(admin_only)
+):
+    """Delete several users in one statement (Admin only)."""
+    # Prevent self-deletion
+    if admin_user.user_id in request.user_ids:
+        raise HTTPException(status_code=400, detail="Cannot delete your own account")
+    
+    try:
+        deleted_count = await asyncio.to_thread(delete_user_profiles, request.user_ids)
+        if deleted_count:
+            invalidate_user_caches(request.user_ids)
+        return ok(deleted_count=deleted_count, message=f"Deleted {deleted_count} user(s)")
+    except Exception as e:
+        logger.error("Error bulk deleting users: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1958,30 +1928,30 @@ async def admin_update_class(
     name: Optional[str] = None,
     code: Optional[str] = None,
     description: Optional[str] = None,
-    admin_user: UserContext = Depends(get_current_user)
+    admin_user: UserContext = Depends(admin_only)
 ):
     """Update a class (Admin only)."""
-    if not admin_user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
-        update_data = {}
-        if name is not None:
-            update_data["name"] = name
-        if code is not None:
-            update_data["code"] = code
-        if description is not None:
-            update_data["description"] = description
+        update_data = {
+            key: value
+            for key, value in (("name", name), ("code", code), ("description", description))
+            if value is not None
+        }
         
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
+        # Reject malformed codes before hitting the database
+        if code is not None and not _CLASS_CODE_RE.fullmatch(code):
+            raise HTTPException(status_code=400, detail="Invalid class code. Use up to 50 letters, digits, spaces, '.', '-' or '_'")
+        
         if not db_supabase:
             raise HTTPException(status_code=500, detail="Database not available")
         
-        result = db_supabase.table("classes").update(update_data).eq("id", class_id).execute()
+        result = await asyncio.to_thread(db_supabase.table("classes").update(update_data).eq("id", class_id).execute)
         
         if result.data and len(result.data) > 0:
+            invalidate_admin_cache()
             return {
                 "success": True,
                 "message": "Class updated successfully",
@@ -1992,32 +1962,29 @@ async def admin_update_class(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error updating class: {e}", exc_info=True)
+        logger.error("Error updating class: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.delete("/admin/classes/{class_id}")
 async def admin_delete_class(
     class_id: str,
-    admin_user: UserContext = Depends(get_current_user)
+    admin_user: UserContext = Depends(admin_only)
 ):
     """Delete a class (Admin only)."""
-    if not admin_user.is_admin():
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
     try:
         if not db_supabase:
             raise HTTPException(status_code=500, detail="Database not available")
         
         # Delete class (cascade should handle related records)
-        result = db_supabase.table("classes").delete().eq("id", class_id).execute()
+        result = await asyncio.to_thread(db_supabase.table("classes").delete().eq("id", class_id).execute)
+        invalidate_teacher_students_cache()
+        invalidate_teacher_classes_cache()
+        invalidate_admin_cache()
         
-        return {
-            "success": True,
-            "message": "Class deleted successfully"
-        }
+        return ok(message="Class deleted successfully")
     except Exception as e:
-        logger.error(f"Error deleting class: {e}", exc_info=True)
+        logger.error("Error deleting class: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============================================================
@@ -2028,7 +1995,7 @@ async def admin_delete_class(
 async def get_analytics(
     assignment_id: Optional[str] = None,
     class_id: Optional[str] = None,
-    user: UserContext = Depends(get_current_user)
+    user: UserContext = Depends(teacher_or_admin)
 ):
     """
     Get analytics for teacher's assignments.
@@ -2036,32 +2003,18 @@ async def get_analytics(
     Returns submission rates, average grades, and late submission percentages.
     Can be filtered by assignment_id or class_id.
     """
-    if not user.is_teacher() and not user.is_admin():
-        raise HTTPException(
-            status_code=403,
-            detail="Only teachers and admins can view analytics"
-        )
-    
     try:
-        # Handle dev mode
-        actual_user_id = user.user_id
-        dev_user_id = "00000000-0000-0000-0000-000000000001"
-        if user.user_id == dev_user_id or user.user_id == "dev-user-id":
-            existing_user = get_user_by_email(user.email)
-            if existing_user:
-                actual_user_id = existing_user['id']
-        
         if assignment_id:
-            analytics = get_assignment_analytics(actual_user_id, assignment_id=assignment_id, class_id=class_id)
+            analytics = await asyncio.to_thread(get_assignment_analytics, user.user_id, assignment_id=assignment_id, class_id=class_id)
         else:
-            analytics = get_overall_analytics(actual_user_id, class_id=class_id)
+            analytics = await asyncio.to_thread(get_overall_analytics, user.user_id, class_id=class_id)
         
         return {
             "success": True,
             **analytics
         }
     except Exception as e:
-        logger.error(f"Error fetching analytics: {e}", exc_info=True)
+        logger.error("Error fetching analytics: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============================================================
@@ -2084,11 +2037,17 @@ async def validation_error_handler(request, exc):
 
 if __name__ == "__main__":
     logger.info("Starting TeachMate Assignment Creator API (RBAC)...")
+    # DEV=1 enables the autoreloader (single process); otherwise run WEB_CONCURRENCY workers.
+    # loop/http "auto" pick uvloop and httptools when installed and fall back to asyncio/h11.
+    dev_mode = os.getenv("DEV") == "1"
     uvicorn.run(
         "main_rbac:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=dev_mode,
+        workers=None if dev_mode else int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="auto",
+        http="auto",
         log_level="info"
     )
 
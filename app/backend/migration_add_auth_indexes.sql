@@ -0,0 +1,57 @@
+-- Migration: Ensure composite indexes behind class authorization checks
+-- Run this in your Supabase SQL Editor
+--
+-- Teacher class lookups filter teacher_class by teacher_id (the leading
+-- column of (teacher_id, class_id)), enrollment checks look up student_class by
+-- (student_id, class_id), and enroll_by_code looks up classes by code.
+-- migration_multi_class.sql already declares UNIQUE constraints on all three,
+-- so on a database built from it this is a no-op. It only adds the unique
+-- indexes where a table was created without those constraints.
+--
+-- Class codes are matched case-sensitively (code = ...), so no lower(code)
+-- index is needed.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        WHERE i.indrelid = 'teacher_class'::regclass
+          AND i.indisunique
+          AND i.indkey::text = (
+              SELECT string_agg(a.attnum::text, ' ' ORDER BY k.ord)
+              FROM unnest(ARRAY['teacher_id', 'class_id']) WITH ORDINALITY AS k(col, ord)
+              JOIN pg_attribute a ON a.attrelid = 'teacher_class'::regclass AND a.attname = k.col
+          )
+    ) THEN
+        CREATE UNIQUE INDEX idx_teacher_class_teacher_class ON teacher_class(teacher_id, class_id);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        WHERE i.indrelid = 'student_class'::regclass
+          AND i.indisunique
+          AND i.indkey::text = (
+              SELECT string_agg(a.attnum::text, ' ' ORDER BY k.ord)
+              FROM unnest(ARRAY['student_id', 'class_id']) WITH ORDINALITY AS k(col, ord)
+              JOIN pg_attribute a ON a.attrelid = 'student_class'::regclass AND a.attname = k.col
+          )
+    ) THEN
+        CREATE UNIQUE INDEX idx_student_class_student_class ON student_class(student_id, class_id);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'classes'::regclass
+          AND i.indnatts = 1
+          AND a.attname = 'code'
+    ) THEN
+        CREATE UNIQUE INDEX idx_classes_code_unique ON classes(code);
+    END IF;
+END $$;
+
+-- Verify indexes
+SELECT tablename, indexname, indexdef
+FROM pg_indexes
+WHERE tablename IN ('teacher_class', 'student_class', 'classes')
+ORDER BY tablename, indexname;
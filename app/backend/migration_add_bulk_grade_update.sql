@@ -0,0 +1,31 @@
+-- Migration: Add bulk_update_submission_grades function
+-- Run this in your Supabase SQL Editor
+--
+-- Grading writes every graded submission in one call instead of one UPDATE per
+-- submission. Called from db_helpers.bulk_update_submission_grades via RPC.
+-- NULL plagiarism_score / web_sources / academic_sources keep the stored value.
+
+CREATE OR REPLACE FUNCTION bulk_update_submission_grades(payload JSONB)
+RETURNS TABLE (id UUID)
+LANGUAGE sql
+AS $$
+    UPDATE submissions AS s
+    SET grade = r.grade,
+        grade_reason = r.grade_reason,
+        plagiarism_score = COALESCE(r.plagiarism_score, s.plagiarism_score),
+        web_sources = COALESCE(r.web_sources, s.web_sources),
+        academic_sources = COALESCE(r.academic_sources, s.academic_sources)
+    FROM jsonb_to_recordset(payload) AS r(
+        id UUID,
+        grade NUMERIC,
+        grade_reason TEXT,
+        plagiarism_score NUMERIC,
+        web_sources JSONB,
+        academic_sources JSONB
+    )
+    WHERE s.id = r.id
+    RETURNING s.id;
+$$;
+
+-- Verify function was created
+SELECT proname FROM pg_proc WHERE proname = 'bulk_update_submission_grades';
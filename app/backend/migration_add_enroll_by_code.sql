@@ -0,0 +1,30 @@
+-- Migration: Add enroll_by_code function
+-- Run this in your Supabase SQL Editor
+--
+-- Student self-enrollment by class code used to take three round-trips
+-- (find class, check enrollment, insert). This does all three in one statement.
+-- Returns no row if the code doesn't match a class; inserted = FALSE means the
+-- student was already enrolled.
+
+CREATE OR REPLACE FUNCTION enroll_by_code(student_uuid UUID, enroll_code TEXT)
+RETURNS TABLE (
+    class_id UUID,
+    class_name TEXT,
+    class_code TEXT,
+    inserted BOOLEAN
+) AS $$
+    WITH c AS (
+        SELECT id, name, code FROM classes WHERE code = enroll_code
+    ),
+    ins AS (
+        INSERT INTO student_class (student_id, class_id)
+        SELECT student_uuid, c.id FROM c
+        ON CONFLICT (student_id, class_id) DO NOTHING
+        RETURNING student_class.class_id
+    )
+    SELECT c.id, c.name, c.code, EXISTS (SELECT 1 FROM ins)
+    FROM c;
+$$ LANGUAGE sql;
+
+-- Verify function was created
+SELECT proname FROM pg_proc WHERE proname = 'enroll_by_code';
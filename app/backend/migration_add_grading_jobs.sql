@@ -0,0 +1,27 @@
+-- Migration: Add grading_jobs table
+-- Run this in your Supabase SQL Editor
+--
+-- /grade-assignment now dispatches grading to a background task and returns a
+-- job id immediately. Job progress is persisted here and polled through
+-- GET /grade-status/{job_id}.
+
+CREATE TABLE IF NOT EXISTS grading_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    assignment_id UUID NOT NULL REFERENCES assignments(id) ON DELETE CASCADE,
+    teacher_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'running' CHECK (status IN ('running', 'done', 'failed')),
+    graded_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_grading_jobs_assignment_id ON grading_jobs(assignment_id);
+CREATE INDEX IF NOT EXISTS idx_grading_jobs_teacher_id ON grading_jobs(teacher_id);
+
+-- Verify table was created
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'grading_jobs';
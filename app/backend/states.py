@@ -1,9 +1,10 @@
-from typing import TypedDict, Optional, List
+from dataclasses import dataclass
+from typing import TypedDict, Optional, List, FrozenSet
 from pydantic import BaseModel, Field
 
 class Rubric(BaseModel):
     total_points: int = Field(..., description="Total possible points")
-    criteria: List[str] = Field(..., description="Criterion name to max points mapping")
+    criteria: List[str] = Field(..., description="Grading criterion for each question, in question order")
 
 class AssignmentCreate(TypedDict):
     topic: str
@@ -28,11 +29,13 @@ class RubricGrade(BaseModel):
     total_score: float = Field(..., description="Total score awarded")
     reason: str = Field(..., description="Explanation for the grade")
 
-class SourceMatch(BaseModel):
-    url: str = Field(..., description="URL of the matched source")
-    title: Optional[str] = Field(None, description="Title of the source")
-    similarity: float = Field(..., description="Similarity score (0-100)")
-    snippet: Optional[str] = Field(None, description="Matching text snippet")
+# Plain slotted dataclass: built internally (up to 10 per submission) and never parsed from LLM output
+@dataclass(slots=True)
+class SourceMatch:
+    url: str  # URL of the matched source
+    similarity: float  # Similarity score (0-100)
+    title: Optional[str] = None  # Title of the source
+    snippet: Optional[str] = None  # Matching text snippet
 
 class Submissions(BaseModel):
     submission_id: str = Field(..., description="Submission ID")
@@ -48,4 +51,4 @@ class AssignmentGrade(TypedDict, total=False):
     submission_ids: List[Submissions]
     rubric: Optional[str]
     questions: Optional[str]
-    student_ids: Optional[List[str]]  # Filter submissions to only these students
\ No newline at end of file
+    student_ids: Optional[FrozenSet[str]]  # Filter submissions to only these students
\ No newline at end of file
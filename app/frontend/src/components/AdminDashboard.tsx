@@ -378,6 +378,9 @@ const AdminDashboard: React.FC<AdminDashboardProps> = ({ user, profile, onSignOu
                             <h4>{cls.name}</h4>
                             {cls.code && <p className="class-code">Code: {cls.code}</p>}
                             {cls.description && <p className="class-description">{cls.description}</p>}
+                            <p className="class-code">
+                              Teachers: {cls.teacher_count ?? 0} · Students: {cls.student_count ?? 0}
+                            </p>
                           </div>
                           <button
                             onClick={() => handleDeleteClass(cls.id)}
@@ -439,6 +442,10 @@ const AdminDashboard: React.FC<AdminDashboardProps> = ({ user, profile, onSignOu
                                 <span className="meta-label">Questions:</span>
                                 <span className="meta-value">{assignment.num_questions}</span>
                               </div>
+                              <div className="meta-item">
+                                <span className="meta-label">Submissions:</span>
+                                <span className="meta-value">{assignment.submission_count ?? 0}</span>
+                              </div>
                               {assignment.deadline && (
                                 <div className="meta-item">
                                   <span className="meta-label">Deadline:</span>
@@ -314,9 +314,11 @@ export const apiService = {
 
   /**
    * Grade assignment (Teacher/Admin only)
-   * Grades all submissions for an assignment using AI
+   * Grades all submissions for an assignment using AI.
+   * Grading runs as a background job on the server; this polls
+   * /grade-status/{job_id} until the job finishes (or maxWaitMs passes) and returns its result.
    */
-  async gradeAssignment(assignmentId: string) {
+  async gradeAssignment(assignmentId: string, pollIntervalMs: number = 3000, maxWaitMs: number = 30 * 60 * 1000) {
     const response = await apiRequest(`/grade-assignment?assignment_id=${assignmentId}`, {
       method: 'POST',
     });
@@ -326,7 +328,36 @@ export const apiService = {
       throw new Error(error.detail || error.error || 'Failed to grade assignment');
     }
     
-    return response.json();
+    const job = await response.json();
+    
+    // No job dispatched (e.g. no submissions yet) - result is already final
+    if (!job.job_id) {
+      return job;
+    }
+    
+    const deadline = Date.now() + maxWaitMs;
+    
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, pollIntervalMs));
+      
+      const statusResponse = await apiRequest(`/grade-status/${job.job_id}`);
+      
+      if (!statusResponse.ok) {
+        const error = await statusResponse.json().catch(() => ({ error: 'Unknown error' }));
+        throw new Error(error.detail || error.error || 'Failed to fetch grading status');
+      }
+      
+      const status = await statusResponse.json();
+      
+      if (status.status === 'failed') {
+        throw new Error(status.message || 'Failed to grade assignment');
+      }
+      if (status.status === 'done') {
+        return status;
+      }
+    }
+    
+    throw new Error('Grading is taking longer than expected. Check back later for results.');
   },
 
   /**
@@ -564,6 +595,23 @@ export const apiService = {
     return response.json();
   },
 
+  /**
+   * Update roles for several users at once (Admin only)
+   */
+  async bulkUpdateUserRoles(updates: { user_id: string; new_role: string }[]) {
+    const response = await apiRequest('/admin/users/roles', {
+      method: 'PUT',
+      body: JSON.stringify({ updates }),
+    });
+    
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ error: 'Unknown error' }));
+      throw new Error(error.detail || error.error || 'Failed to update user roles');
+    }
+    
+    return response.json();
+  },
+
   /**
    * Assign teacher to class (Admin only)
    */
@@ -628,6 +676,23 @@ export const apiService = {
     return response.json();
   },
 
+  /**
+   * Delete several users at once (Admin only)
+   */
+  async bulkDeleteUsers(userIds: string[]) {
+    const response = await apiRequest('/admin/users/bulk-delete', {
+      method: 'POST',
+      body: JSON.stringify({ user_ids: userIds }),
+    });
+    
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ error: 'Unknown error' }));
+      throw new Error(error.detail || error.error || 'Failed to delete users');
+    }
+    
+    return response.json();
+  },
+
   /**
    * Update class (Admin only)
    */